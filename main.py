@@ -1,259 +1,714 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+from flask_compress import Compress
 import openai
+import httpx
+import atexit
 import json
+import operator
 import re
 import os
 import time
+import threading
+import hashlib
+import queue
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache, wraps
 from dotenv import load_dotenv
-from flask_bcrypt import Bcrypt
+import bcrypt
 from flask_jwt_extended import (
     JWTManager, 
     create_access_token, 
-    jwt_required, 
+    verify_jwt_in_request,
     get_jwt_identity
 )
 import sqlite3
+import fcntl
+import orjson
 from typing import Dict, Any, Optional
 
+class OrjsonProvider(JSONProvider):
+    """Use orjson for jsonify responses and request.get_json parsing"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+            mimetype="application/json"
+        )
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
+# Compress JSON responses (gzip/brotli, negotiated via Accept-Encoding)
+app.config["COMPRESS_MIMETYPES"] = ["application/json"]
+# Streamed bodies are sent as produced rather than buffered for compression
+app.config["COMPRESS_STREAMS"] = False
+Compress(app)
+
+@lru_cache(maxsize=None)
+def error_body(message: str) -> bytes:
+    """Encoded {"error": message} envelope; only called with fixed messages"""
+    return orjson.dumps({"error": message})
+
+def error_response(message: str, status: int):
+    """Build an error response from the cached envelope bytes, skipping JSON encoding"""
+    return app.response_class(error_body(message), status=status, mimetype="application/json")
+
 # Load environment variables
 load_dotenv()
 
 # Configure app settings
 app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
 DEFAULT_TIME_LIMIT = 30
+# bcrypt cost for new hashes; existing hashes keep verifying at their own cost
+BCRYPT_LOG_ROUNDS = 10
 
 # Initialize extensions
-bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
 
+class TTLCache:
+    """Thread-safe in-process cache with per-entry expiry; evicts least recently used entries beyond maxsize"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (value, expires_at)
+        self.lock = threading.Lock()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            if entry[1] <= time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+# Verified access tokens, so repeat requests with the same token skip
+# signature verification; entries never outlive the token's own expiry
+JWT_CACHE_SIZE = 10000
+JWT_CACHE_TTL = 30  # seconds
+jwt_cache = TTLCache(JWT_CACHE_SIZE, JWT_CACHE_TTL)
+
+def cached_jwt_required(fn):
+    """Drop-in for @jwt_required() that reuses recent verifications of the same bearer token"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get("Authorization", "")
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()[:32] if token else None
+        verified = jwt_cache.get(key) if key else None
+        if verified:
+            # Same request-context state verify_jwt_in_request leaves behind,
+            # so get_jwt_identity() works unchanged in the view
+            g._jwt_extended_jwt_header, g._jwt_extended_jwt = verified
+            g._jwt_extended_jwt_user = {"loaded_user": None}
+            g._jwt_extended_jwt_location = "headers"
+        else:
+            verified = verify_jwt_in_request()
+            if key and verified:
+                jwt_data = verified[1]
+                ttl = min(JWT_CACHE_TTL, jwt_data["exp"] - time.time()) if "exp" in jwt_data else JWT_CACHE_TTL
+                if ttl > 0:
+                    jwt_cache.set(key, verified, ttl)
+        return fn(*args, **kwargs)
+    return wrapper
+
+# bcrypt releases the GIL while hashing, so a thread pool spreads logins
+# across cores without the pickling and fork cost of worker processes
+bcrypt_pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="bcrypt")
+
 # Azure OpenAI Configuration
+OPENAI_TIMEOUT = 60  # seconds; batched generation responses can be long
+OPENAI_CONNECT_TIMEOUT = 5
+OPENAI_MAX_CONNECTIONS = 64
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 32
+# httpx drops idle connections after 5s by default; keep them long enough
+# that traffic gaps between requests do not cost a new TLS handshake
+OPENAI_KEEPALIVE_EXPIRY = 60  # seconds
+# The SDK retries 429, 5xx, timeouts and connection errors with exponential
+# backoff and jitter, honouring Retry-After
+OPENAI_MAX_RETRIES = 3
+
+# One module-level HTTP client keeps TLS connections alive across requests
+# and evaluation threads instead of reconnecting for every call
+openai_http_client = openai.DefaultHttpxClient(
+    limits=httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+    ),
+    timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+)
+
 openai_client = openai.AzureOpenAI(
     azure_endpoint=os.getenv("API_ENDPOINT"),
     api_key=os.getenv("API_KEY"),
     api_version=os.getenv("API_VERSION"),
+    http_client=openai_http_client,
+    max_retries=OPENAI_MAX_RETRIES,
 )
-
-# Global variables
-question_start_times: Dict[str, Dict[str, float]] = {}
+atexit.register(openai_http_client.close)
+
+# Proactive pacing against the deployment's quota, so bursts wait locally
+# instead of turning into 429s and retries. Set OPENAI_RPM_LIMIT and
+# OPENAI_TPM_LIMIT to the deployment's limits; unset or 0 disables a limit.
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "0"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "0"))
+CHARS_PER_TOKEN = 4  # rough estimate for English prompts
+
+class TokenBucket:
+    """Thread-safe token bucket holding up to capacity tokens, refilled
+    continuously over per_seconds"""
+
+    def __init__(self, capacity: int, per_seconds: float = 60):
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1) -> None:
+        """Block until amount tokens are available, then take them"""
+        # A request larger than the bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+rpm_bucket = TokenBucket(OPENAI_RPM_LIMIT) if OPENAI_RPM_LIMIT else None
+tpm_bucket = TokenBucket(OPENAI_TPM_LIMIT) if OPENAI_TPM_LIMIT else None
+
+def throttle_openai(texts: list, max_tokens: int = 0) -> None:
+    """Wait for request and token budget before an OpenAI call. Azure counts
+    max_tokens against TPM up front, so it is included in the estimate."""
+    if rpm_bucket:
+        rpm_bucket.acquire()
+    if tpm_bucket:
+        tpm_bucket.acquire(sum(len(text) for text in texts) // CHARS_PER_TOKEN + max_tokens)
 
 # Database helper functions
-def get_db_connection(db_name: str = "users.db") -> sqlite3.Connection:
-    """Create a database connection with Row factory"""
-    conn = sqlite3.connect(db_name)
-    conn.row_factory = sqlite3.Row
-    return conn
+DB_NAME = "app.db"
+
+# Applied to every new connection; under WAL, synchronous=NORMAL skips the
+# fsync on each commit while staying crash-safe
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000"
+]
+
+DB_POOL_SIZE = 8
+DB_POOL_TIMEOUT = 10  # seconds to wait for a free connection
+
+class ConnectionPool:
+    """Fixed-size pool of long-lived connections shared by all threads.
+
+    Check a connection out with `with db_pool.acquire() as conn:`; it goes back
+    to the pool when the block exits. Connections run in autocommit mode
+    (isolation_level=None); multi-statement writes open their transaction with
+    an explicit BEGIN.
+    """
+
+    def __init__(self, db_name: str, size: int):
+        self.db_name = db_name
+        # LIFO hands out the most recently used connection, whose page cache
+        # is warmest
+        self.idle = queue.LifoQueue()
+        for _ in range(size):
+            self.idle.put(self.connect())
+
+    def connect(self) -> sqlite3.Connection:
+        """Open and configure a new connection"""
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def acquire(self):
+        """Check out a connection, waiting up to DB_POOL_TIMEOUT seconds"""
+        try:
+            conn = self.idle.get(timeout=DB_POOL_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError("Timed out waiting for a database connection")
+        try:
+            yield conn
+        finally:
+            # Never hand the next caller a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put(conn)
+
+db_pool = ConnectionPool(DB_NAME, DB_POOL_SIZE)
+
+# Redis cache for read-heavy endpoints, enabled by setting REDIS_URL. The
+# cache is best-effort: any Redis error is logged and treated as a miss.
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_SOCKET_TIMEOUT = 0.2  # seconds
+RESULTS_CACHE_TTL = 300  # seconds
+
+if REDIS_URL:
+    # Imported only when configured, so redis-py is an optional dependency
+    import redis
+    redis_client = redis.Redis.from_url(
+        REDIS_URL,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT
+    )
+    RedisError = redis.RedisError
+else:
+    redis_client = None
+    # Never raised: every Redis call is skipped when there is no client
+    RedisError = Exception
+
+def cache_get(key: str) -> Optional[bytes]:
+    """Return a cached value, or None on a miss or when Redis is unavailable"""
+    if redis_client is None:
+        return None
+    try:
+        return redis_client.get(key)
+    except RedisError as e:
+        print(f"Warning: Redis get failed: {str(e)}")
+        return None
+
+def cache_set(key: str, value: bytes, ttl: int = RESULTS_CACHE_TTL) -> None:
+    """Store a value with an expiry; failures are ignored"""
+    if redis_client is None:
+        return
+    try:
+        redis_client.setex(key, ttl, value)
+    except RedisError as e:
+        print(f"Warning: Redis set failed: {str(e)}")
+
+# Per-user hash of question id -> generation time, shared by all workers.
+# Wall-clock time is stored because monotonic clocks differ between processes.
+QUESTION_START_TTL = 3600  # seconds
+# Without Redis, start times live in a bounded per-process cache instead,
+# keyed "user_id:question_id"; only a single-worker deploy sees them all
+QUESTION_START_CACHE_SIZE = 50000
+local_question_starts = TTLCache(QUESTION_START_CACHE_SIZE, QUESTION_START_TTL)
+
+def record_question_start_times(user_id: str, question_ids: list) -> None:
+    """Remember when each generated question was handed to the user"""
+    if not question_ids:
+        return
+    now = time.time()
+    if redis_client is None:
+        for q_id in question_ids:
+            local_question_starts.set(f"{user_id}:{q_id}", now)
+        return
+    key = f"qstart:{user_id}"
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hset(key, mapping={str(q_id): now for q_id in question_ids})
+        pipe.expire(key, QUESTION_START_TTL)
+        pipe.execute()
+    except RedisError as e:
+        print(f"Warning: Could not record question start times: {str(e)}")
+
+def get_question_start_times(user_id: str, question_ids: list) -> Dict[str, float]:
+    """Return the recorded start time of each question id that has one"""
+    if not question_ids:
+        return {}
+    if redis_client is None:
+        starts = {str(q_id): local_question_starts.get(f"{user_id}:{q_id}") for q_id in question_ids}
+        return {q_id: start for q_id, start in starts.items() if start is not None}
+    try:
+        values = redis_client.hmget(f"qstart:{user_id}", [str(q_id) for q_id in question_ids])
+    except RedisError as e:
+        print(f"Warning: Could not read question start times: {str(e)}")
+        return {}
+    return {str(q_id): float(value) for q_id, value in zip(question_ids, values) if value is not None}
+
+# Each user's most recently generated exam, so /validate_answers can grade
+# from the server's copy and clients only need to post their answers. Kept
+# in Redis only: gunicorn workers do not share memory, so without REDIS_URL
+# clients must always send the questions.
+EXAM_STATE_TTL = QUESTION_START_TTL
+
+def save_exam_state(user_id: str, questions: list, subject: str) -> None:
+    """Store the question set just handed to a user"""
+    cache_set(f"exam:{user_id}", orjson.dumps({"questions": questions, "subject": subject}), EXAM_STATE_TTL)
+
+def claim_exam_state(user_id: str) -> Optional[dict]:
+    """Remove and return the user's last generated {"questions", "subject"},
+    or None if expired, already graded or Redis is not configured"""
+    if redis_client is None:
+        return None
+    try:
+        body = redis_client.getdel(f"exam:{user_id}")
+    except RedisError as e:
+        print(f"Warning: Redis getdel failed: {str(e)}")
+        return None
+    return orjson.loads(body) if body else None
+
+def clear_exam_state(user_id: str) -> None:
+    """Forget the user's last generated exam once it has been graded"""
+    if redis_client is None:
+        return
+    try:
+        redis_client.delete(f"exam:{user_id}")
+    except RedisError as e:
+        print(f"Warning: Redis delete failed: {str(e)}")
+
+# A user's cached exam details share one hash, detail:{user_id}, keyed by
+# exam id, so invalidation is a single DEL instead of a keyspace scan
+def detail_cache_get(user_id: str, exam_id: int) -> Optional[bytes]:
+    """Return a cached exam detail body, or None on a miss or when Redis is unavailable"""
+    if redis_client is None:
+        return None
+    try:
+        return redis_client.hget(f"detail:{user_id}", str(exam_id))
+    except RedisError as e:
+        print(f"Warning: Redis get failed: {str(e)}")
+        return None
+
+def detail_cache_set(user_id: str, exam_id: int, value: bytes, ttl: int = RESULTS_CACHE_TTL) -> None:
+    """Store an exam detail body; the whole hash expires ttl seconds after the last store"""
+    if redis_client is None:
+        return
+    key = f"detail:{user_id}"
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hset(key, mapping={str(exam_id): value})
+        pipe.expire(key, ttl)
+        pipe.execute()
+    except RedisError as e:
+        print(f"Warning: Redis set failed: {str(e)}")
+
+def invalidate_user_cache(user_id: str) -> None:
+    """Drop a user's cached results list and exam details after a write"""
+    if redis_client is None:
+        return
+    try:
+        redis_client.delete(f"results:{user_id}", f"detail:{user_id}")
+    except RedisError as e:
+        print(f"Warning: Redis invalidation failed: {str(e)}")
+
+def add_missing_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str) -> None:
+    """Add a column to a table that was created before the column existed"""
+    columns = [col[1] for col in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+# Stored in PRAGMA user_version once init_databases has brought the schema
+# up to date; bump it when the schema below changes
+SCHEMA_VERSION = 3
+INIT_LOCK_FILE = f"{DB_NAME}.init.lock"
+
+@contextmanager
+def init_lock():
+    """Hold an exclusive file lock so only one worker process initializes the
+    database; the others wait, then find the schema already current"""
+    with open(INIT_LOCK_FILE, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 def init_databases():
     """Initialize all required database tables"""
     print("Starting database initialization...")
     
-    try:
-        # Create exam_questions.db first
-        print("Creating exam_questions.db tables...")
-        conn = get_db_connection("exam_questions.db")
-        cursor = conn.cursor()
-        
-        # Create questions table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS questions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                exam_id INTEGER NOT NULL,
-                question_text TEXT NOT NULL,
-                question_type TEXT NOT NULL,
-                options TEXT,
-                correct_answer TEXT,
-                subject TEXT DEFAULT 'General'
-            )
-        """)
-        print("Created questions table")
-        
-        # Create user_answers table with accuracy_percentage column
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_answers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                exam_id INTEGER NOT NULL,
-                user_id TEXT NOT NULL,
-                question_id INTEGER NOT NULL,
-                answer TEXT,
-                is_correct INTEGER,
-                accuracy_percentage REAL DEFAULT 0,
-                time_taken INTEGER,
-                FOREIGN KEY (question_id) REFERENCES questions (id)
-            )
-        """)
-        print("Created user_answers table")
-        conn.commit()
-        conn.close()
+    with init_lock(), db_pool.acquire() as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            print(f"{DB_NAME} schema is up to date (version {version})")
+            return
 
-        # Create exam_results.db
-        print("Creating exam_results.db tables...")
-        conn = get_db_connection("exam_results.db")
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                score REAL NOT NULL,
-                grade TEXT NOT NULL,
-                status TEXT NOT NULL,
-                subject TEXT DEFAULT 'General',
-                total_questions INTEGER NOT NULL,
-                correct_answers INTEGER NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
+        try:
+            print(f"Creating {DB_NAME} tables...")
+            cursor = conn.cursor()
+            cursor.execute("BEGIN")
 
-        # Create detailed results table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS detailed_results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                exam_id INTEGER NOT NULL,
-                question_id INTEGER NOT NULL,
-                score FLOAT,
-                feedback TEXT,
-                evaluation_data TEXT,
-                FOREIGN KEY (exam_id) REFERENCES results (id)
-            )
-        """)
-        conn.commit()
-        conn.close()
-        print("Database initialization completed successfully")
+            # Create users table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    email TEXT UNIQUE NOT NULL,
+                    password TEXT NOT NULL,
+                    first_name TEXT NOT NULL,
+                    last_name TEXT NOT NULL
+                )
+            """)
+            print("Created users table")
+
+            # Create questions table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS questions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    exam_id INTEGER NOT NULL,
+                    question_text TEXT NOT NULL,
+                    question_type TEXT NOT NULL,
+                    options TEXT,
+                    correct_answer TEXT,
+                    subject TEXT DEFAULT 'General'
+                )
+            """)
+            print("Created questions table")
+
+            # Create user_answers table with accuracy_percentage column
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS user_answers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    exam_id INTEGER NOT NULL,
+                    user_id TEXT NOT NULL,
+                    question_id INTEGER NOT NULL,
+                    answer TEXT,
+                    is_correct INTEGER,
+                    accuracy_percentage REAL DEFAULT 0,
+                    time_taken INTEGER,
+                    FOREIGN KEY (question_id) REFERENCES questions (id)
+                )
+            """)
+            print("Created user_answers table")
+
+            # Create results table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    grade TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    subject TEXT DEFAULT 'General',
+                    total_questions INTEGER NOT NULL,
+                    correct_answers INTEGER NOT NULL,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    batch_id TEXT,
+                    batch_status TEXT,
+                    pre_batch_status TEXT,
+                    batch_claimed_at REAL
+                )
+            """)
+            add_missing_column(cursor, "results", "batch_id", "TEXT")
+            add_missing_column(cursor, "results", "batch_status", "TEXT")
+            add_missing_column(cursor, "results", "pre_batch_status", "TEXT")
+            add_missing_column(cursor, "results", "batch_claimed_at", "REAL")
+            print("Created results table")
+
+            # Create detailed results table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS results_detailed (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    exam_id INTEGER NOT NULL,
+                    question_id INTEGER NOT NULL,
+                    score FLOAT,
+                    feedback TEXT,
+                    evaluation_data TEXT,
+                    FOREIGN KEY (exam_id) REFERENCES results (id)
+                )
+            """)
+            print("Created results_detailed table")
+
+            # Create evaluation cache table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS eval_cache (
+                    key TEXT PRIMARY KEY,
+                    evaluation_json TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            print("Created eval_cache table")
+
+            # Create indexes for the per-user and per-exam lookups
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_results_user_ts ON results (user_id, timestamp DESC)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_exam_subject ON questions (exam_id, subject)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_answers_exam ON user_answers (exam_id, user_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_results_detailed_exam ON results_detailed (exam_id, question_id)")
+            print("Created indexes")
+
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
 
-    except Exception as e:
-        print(f"Error during database initialization: {str(e)}")
-        raise
-    finally:
-        try:
-            conn.close()
-        except:
-            pass
+            # Refresh planner statistics so the new indexes are used
+            cursor.execute("ANALYZE")
+            print("Database initialization completed successfully")
+
+        except Exception as e:
+            print(f"Error during database initialization: {str(e)}")
+            conn.rollback()
+            raise
 
 def verify_db_structure():
     """Verify database structure and print current state"""
     try:
-        # Check exam_questions.db structure
-        conn = get_db_connection("exam_questions.db")
-        tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
-        print("\nTables in exam_questions.db:", [t[0] for t in tables])
-        
-        # Print schema for each table
-        for table in tables:
-            schema = conn.execute(f"PRAGMA table_info({table[0]})").fetchall()
-            print(f"\nSchema for {table[0]}:")
-            for col in schema:
-                print(f"  {col[1]} ({col[2]})")
-        
-        return True
+        # Check app.db structure
+        with db_pool.acquire() as conn:
+            tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+            print(f"\nTables in {DB_NAME}:", [t[0] for t in tables])
+
+            # Print schema for each table
+            for table in tables:
+                schema = conn.execute(f"PRAGMA table_info({table[0]})").fetchall()
+                print(f"\nSchema for {table[0]}:")
+                for col in schema:
+                    print(f"  {col[1]} ({col[2]})")
+
+            return True
     except Exception as e:
         print(f"Error verifying database structure: {str(e)}")
         return False
-    finally:
-        try:
-            conn.close()
-        except:
-            pass
 
-def save_exam_result(user_id: str, questions: list, answers: dict, score: float, subject: str, detailed_results: list = None) -> int:
-    """Save exam result and all related data"""
+def save_exam_result(
+    user_id: str,
+    questions: list,
+    answers: dict,
+    score: float,
+    subject: str,
+    detailed_results: list = None,
+    correctness: Optional[Dict[str, bool]] = None
+) -> int:
+    """Save exam result and all related data.
+
+    correctness maps question id to the caller's already-computed result for
+    user_answers.is_correct; without it, non-essay/coding answers are compared
+    here.
+    """
     # Calculate grade based on score
     grade = calculate_grade(score)
-    status = "Passed" if score >= 60 else "Failed"
+    status = calculate_pass_status(score)
     total_questions = len(questions)
     
     # Save main result
-    conn = get_db_connection("exam_results.db")
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO results (
+    with db_pool.acquire() as conn:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN")
+            exam_id = cursor.execute("""
+                INSERT INTO results (
+                    user_id, score, grade, status, subject,
+                    total_questions, correct_answers, timestamp
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                RETURNING id
+            """, (
                 user_id, score, grade, status, subject,
-                total_questions, correct_answers, timestamp
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        """, (
-            user_id, score, grade, status, subject,
-            total_questions, int((score / 100) * total_questions)
-        ))
-        exam_id = cursor.lastrowid
-        conn.commit()
+                total_questions, int((score / 100) * total_questions)
+            )).fetchone()[0]
 
-        # Save detailed results if provided
-        if detailed_results:
-            for result in detailed_results:
-                cursor.execute("""
-                    INSERT INTO detailed_results (
+            cursor.executemany("""
+                INSERT INTO questions (
+                    exam_id, question_text, question_type,
+                    options, correct_answer, subject
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            """, [(
+                exam_id,
+                question["question"],
+                question.get("type", "").lower(),
+                orjson.dumps(question.get("options", [])).decode("utf-8"),
+                question.get("correct_answer", ""),
+                question.get("subject", subject)
+            ) for question in questions])
+
+            # Map the caller's question ids to the rows just inserted; the exam
+            # is new, so its questions are exactly the rows inserted above
+            new_ids = cursor.execute(
+                "SELECT id FROM questions WHERE exam_id = ? ORDER BY id",
+                (exam_id,)
+            ).fetchall()
+            question_ids = {str(question["id"]): row[0] for question, row in zip(questions, new_ids)}
+
+            answer_rows = []
+            for question in questions:
+                q_id = str(question["id"])
+                q_type = question.get("type", "").lower()
+                user_answer = answers.get(q_id, '')
+                is_correct = None
+                if correctness is not None:
+                    if correctness.get(q_id) is not None:
+                        is_correct = int(correctness[q_id])
+                elif q_type not in ['essay', 'coding']:
+                    is_correct = 1 if str(user_answer).strip().lower() == str(question.get("correct_answer", "")).strip().lower() else 0
+
+                answer_rows.append((
+                    exam_id, user_id, question_ids[q_id],
+                    user_answer, is_correct, None
+                ))
+
+            cursor.executemany("""
+                INSERT INTO user_answers (
+                    exam_id, user_id, question_id,
+                    answer, is_correct, time_taken
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            """, answer_rows)
+
+            # Save detailed results if provided
+            if detailed_results:
+                cursor.executemany("""
+                    INSERT INTO results_detailed (
                         exam_id, question_id, score, feedback,
                         evaluation_data
                     ) VALUES (?, ?, ?, ?, ?)
-                """, (
+                """, [(
                     exam_id,
-                    result["question_id"],
+                    question_ids.get(str(result["question_id"]), result["question_id"]),
                     result["score"],
                     result.get("feedback"),
-                    json.dumps(result.get("evaluation"))
-                ))
+                    orjson.dumps(result.get("evaluation")).decode("utf-8")
+                ) for result in detailed_results])
+
             conn.commit()
+            invalidate_user_cache(user_id)
+            return exam_id
 
-        # Save individual questions and answers
-        for question in questions:
-            q_id = str(question["id"])
-            q_type = question.get("type", "").lower()
-            correct_answer = question.get("correct_answer", "")
-            
-            # Save question
-            cursor.execute("""
-                INSERT INTO questions (
-                    id, exam_id, question_text, question_type,
-                    correct_answer, subject
-                ) VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                q_id, exam_id, question["question"], q_type,
-                correct_answer, question.get("subject", subject)
-            ))
-            question_id = cursor.lastrowid
-            
-            # Save user's answer
-            user_answer = answers.get(str(q_id), '')
-            is_correct = None
-            if q_type not in ['essay', 'coding']:
-                is_correct = 1 if str(user_answer).strip().lower() == str(correct_answer).strip().lower() else 0
-            
-            cursor.execute("""
-                INSERT INTO user_answers (
-                    exam_id, user_id, question_id,
-                    answer, is_correct, time_taken
-                ) VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                exam_id, user_id, question_id,
-                user_answer, is_correct, None
-            ))
-        
-        conn.commit()
-        return exam_id
+        except Exception as e:
+            print(f"Error saving exam result: {str(e)}")
+            conn.rollback()
+            raise
 
-    except Exception as e:
-        print(f"Error saving exam result: {str(e)}")
-        conn.rollback()
-        raise
-    finally:
-        conn.close()  # Close the main connection
+# Lower score bounds for D, C, B, A; anything below the first is an F
+GRADE_THRESHOLDS = (60, 70, 80, 90)
+GRADES = ("F", "D", "C", "B", "A")
+
+# SQL counterpart of calculate_grade, built from the same thresholds
+GRADE_CASE_SQL = "CASE {} ELSE 'F' END".format(" ".join(
+    f"WHEN {{score}} >= {threshold} THEN '{grade}'"
+    for threshold, grade in reversed(list(zip(GRADE_THRESHOLDS, GRADES[1:])))
+))
 
 def calculate_grade(score: float) -> str:
     """Calculate letter grade based on score"""
-    if score >= 90:
-        return "A"
-    elif score >= 80:
-        return "B"
-    elif score >= 70:
-        return "C"
-    elif score >= 60:
-        return "D"
-    else:
-        return "F"
+    return GRADES[bisect_right(GRADE_THRESHOLDS, score)]
+
+# Status /submit_exam records: a pass is any grade above F
+PASS_STATUSES = ("Passed", "Failed")
+
+def calculate_pass_status(score: float) -> str:
+    """Passed/Failed status for a score"""
+    return "Passed" if score >= GRADE_THRESHOLDS[0] else "Failed"
 
 def save_user_answer(
     user_id: int,
@@ -264,106 +719,324 @@ def save_user_answer(
     time_taken: Optional[int] = None
 ) -> None:
     """Save user's answer for a question"""
-    conn = get_db_connection("exams.db")
-    try:
-        conn.execute("""
-            INSERT INTO user_answers (
+    with db_pool.acquire() as conn:
+        try:
+            conn.execute("""
+                INSERT INTO user_answers (
+                    user_id, exam_id, question_id, answer,
+                    is_correct, time_taken
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            """, (
                 user_id, exam_id, question_id, answer,
                 is_correct, time_taken
-            ) VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            user_id, exam_id, question_id, answer,
-            is_correct, time_taken
-        ))
-        conn.commit()
-    finally:
-        conn.close()
+            ))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
 def get_exam_details(exam_result_id: int, user_id: int) -> dict:
     """Get detailed exam result including questions and answers"""
-    conn = get_db_connection("exam_results.db")
-    try:
-        # Get exam result
-        result = conn.execute("""
-            SELECT *
-            FROM results 
-            WHERE id = ? AND user_id = ?
-        """, (exam_result_id, user_id)).fetchone()
-        
-        if not result:
-            return None
-            
-        # Convert row to dictionary
-        exam_detail = {
-            "id": str(result["id"]),
-            "score": result["score"],
-            "grade": result["grade"],
-            "status": result["status"],
-            "timestamp": result["timestamp"],
-            "total_questions": result["total_questions"],
-            "correct_answers": result["correct_answers"],
-            "questions": [],
-            "subject": result["subject"] if result["subject"] != "General" else None
-        }
-        
+    with db_pool.acquire() as conn:
         try:
-            # Get questions data with accuracy percentage
-            questions_conn = get_db_connection("exam_questions.db")
-            questions = questions_conn.execute("""
-                SELECT 
-                    q.id, 
-                    q.question_text as question, 
-                    q.correct_answer, 
-                    ua.answer as user_answer, 
-                    q.options, 
+            # Result row joined with its questions and answers in one round trip;
+            # the LEFT JOINs keep the result when no answers were stored
+            rows = conn.execute("""
+                SELECT
+                    r.id,
+                    r.score,
+                    r.grade,
+                    r.status,
+                    r.timestamp,
+                    r.total_questions,
+                    r.correct_answers,
+                    r.subject,
+                    q.id as question_id,
+                    q.question_text as question,
+                    q.correct_answer,
+                    ua.answer as user_answer,
+                    q.options,
                     q.question_type as type,
-                    q.subject,
+                    q.subject as question_subject,
                     ua.accuracy_percentage,
                     ua.is_correct
-                FROM questions q
-                JOIN user_answers ua ON q.id = ua.question_id
-                WHERE ua.exam_id = ? AND ua.user_id = ?
+                FROM results r
+                LEFT JOIN user_answers ua ON ua.exam_id = r.id AND ua.user_id = r.user_id
+                LEFT JOIN questions q ON q.id = ua.question_id
+                WHERE r.id = ? AND r.user_id = ?
                 ORDER BY q.id
             """, (exam_result_id, user_id)).fetchall()
-            
+
+            if not rows:
+                return None
+
+            result = rows[0]
+            exam_detail = {
+                "id": str(result["id"]),
+                "score": result["score"],
+                "grade": result["grade"],
+                "status": result["status"],
+                "timestamp": result["timestamp"],
+                "total_questions": result["total_questions"],
+                "correct_answers": result["correct_answers"],
+                "questions": [],
+                "subject": result["subject"] if result["subject"] != "General" else None
+            }
+
+            questions = [q for q in rows if q["question_id"] is not None]
             if questions:
                 if not exam_detail["subject"]:
-                    subjects = [q["subject"] for q in questions if q["subject"] != "General"]
+                    subjects = [q["question_subject"] for q in questions if q["question_subject"] != "General"]
                     if subjects:
-                        from collections import Counter
                         exam_detail["subject"] = Counter(subjects).most_common(1)[0][0]
                     else:
                         exam_detail["subject"] = "General"
-                
+
                 exam_detail["questions"] = [{
-                    "id": q["id"],
+                    "id": q["question_id"],
                     "question": q["question"],
                     "correct_answer": q["correct_answer"],
                     "user_answer": q["user_answer"],
-                    "options": json.loads(q["options"]) if q["options"] else None,
+                    "options": orjson.loads(q["options"]) if q["options"] else None,
                     "type": q["type"],
-                    "subject": q["subject"],
+                    "subject": q["question_subject"],
                     "accuracy_percentage": q["accuracy_percentage"],
                     "is_correct": bool(q["is_correct"])
                 } for q in questions]
-            
-            questions_conn.close()
+
             return exam_detail
-            
+
         except Exception as e:
-            print(f"Warning: Could not fetch questions data: {str(e)}")
-            return exam_detail
-            
+            print(f"Database error in get_exam_details: {str(e)}")
+            raise
+
+# Background writer for user registrations
+USER_WRITE_BATCH_SIZE = 50
+USER_WRITE_BATCH_WINDOW = 0.05  # seconds
+INSERT_USER_SQL = """
+    INSERT INTO users (email, password, first_name, last_name)
+    VALUES (?, ?, ?, ?)
+"""
+user_write_queue: "queue.Queue[tuple]" = queue.Queue()
+
+def write_user_batch(conn: sqlite3.Connection, batch: list) -> None:
+    """Insert a batch of queued users in one transaction and resolve their futures"""
+    rows = [item[:4] for item in batch]
+    try:
+        conn.execute("BEGIN")
+        conn.executemany(INSERT_USER_SQL, rows)
+        conn.commit()
+        for item in batch:
+            item[4].set_result(None)
+        return
+    except sqlite3.IntegrityError:
+        conn.rollback()
     except Exception as e:
-        print(f"Database error in get_exam_details: {str(e)}")
-        raise
-    finally:
-        conn.close()  # Close the main connection
+        conn.rollback()
+        for item in batch:
+            item[4].set_exception(e)
+        return
+
+    # A row in the batch conflicted; insert row by row so only the
+    # offending registrations fail, still committing once
+    errors = {}
+    try:
+        conn.execute("BEGIN")
+        for index, row in enumerate(rows):
+            try:
+                conn.execute(INSERT_USER_SQL, row)
+            except sqlite3.IntegrityError as e:
+                errors[index] = e
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        for item in batch:
+            item[4].set_exception(e)
+        return
+
+    for index, item in enumerate(batch):
+        if index in errors:
+            item[4].set_exception(errors[index])
+        else:
+            item[4].set_result(None)
+
+def collect_batch(work_queue: queue.Queue, max_size: int, window: float) -> list:
+    """Block for one queued item, then gather more until max_size items or
+    window seconds, whichever comes first"""
+    batch = [work_queue.get()]
+    deadline = time.monotonic() + window
+    while len(batch) < max_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(work_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+def user_writer_loop() -> None:
+    """Write queued registrations in batches. Every future is resolved,
+    since requests wait on them without a timeout."""
+    while True:
+        batch = collect_batch(user_write_queue, USER_WRITE_BATCH_SIZE, USER_WRITE_BATCH_WINDOW)
+        try:
+            with db_pool.acquire() as conn:
+                write_user_batch(conn, batch)
+        except Exception as e:
+            print(f"Error in user writer: {str(e)}")
+            for item in batch:
+                if not item[4].done():
+                    item[4].set_exception(e)
+
+# Background writer for graded submissions: concurrent /validate_answers
+# requests share one transaction and one commit
+EXAM_WRITE_BATCH_SIZE = 20
+EXAM_WRITE_BATCH_WINDOW = 0.01  # seconds
+exam_write_queue: "queue.Queue[tuple]" = queue.Queue()
+
+def insert_graded_exam(
+    cursor: sqlite3.Cursor,
+    user_id: str,
+    subject: str,
+    total_questions: int,
+    gradeable_questions: int,
+    graded: list
+) -> tuple:
+    """Insert one graded submission inside the caller's transaction.
+
+    Returns (exam_id, final score/grade/correct_answers row, detailed_results).
+    """
+    # Insert initial result to get exam_id
+    exam_id = cursor.execute("""
+        INSERT INTO results (
+            user_id, score, grade, status, subject,
+            total_questions, correct_answers, timestamp
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        RETURNING id
+    """, (user_id, 0, 'P', 'In Progress', subject, total_questions, 0)).fetchone()[0]
+
+    cursor.executemany("""
+        INSERT INTO questions (
+            exam_id, question_text, question_type,
+            options, correct_answer, subject
+        ) VALUES (?, ?, ?, ?, ?, ?)
+    """, [(
+        exam_id,
+        entry["question"]["question"],
+        entry["question"].get("type", ""),
+        orjson.dumps(entry["question"].get("options", [])).decode("utf-8"),
+        entry["question"].get("correct_answer", ""),
+        entry["question"].get("subject", subject)
+    ) for entry in graded])
+
+    # executemany discards RETURNING rows, but this transaction holds the
+    # write lock, so the AUTOINCREMENT ids just assigned are consecutive
+    last_question_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+    question_ids = range(last_question_id - len(graded) + 1, last_question_id + 1)
+
+    cursor.executemany("""
+        INSERT INTO user_answers (
+            exam_id, user_id, question_id,
+            answer, is_correct, time_taken
+        ) VALUES (?, ?, ?, ?, ?, ?)
+    """, [(
+        exam_id,
+        user_id,
+        question_id,
+        entry["user_answer"],
+        1 if entry["score"] == 100 else 0,
+        entry["time_taken"]
+    ) for entry, question_id in zip(graded, question_ids)])
+
+    detailed_results = [{
+        "question_id": question_id,
+        "score": entry["score"],
+        "feedback": entry["feedback"],
+        "evaluation": entry["evaluation"]
+    } for entry, question_id in zip(graded, question_ids)]
+
+    # Score and grade the exam from the answer rows just written
+    final = cursor.execute(f"""
+        UPDATE results
+        SET score = totals.score,
+            grade = {GRADE_CASE_SQL.format(score="totals.score")},
+            status = 'Completed',
+            correct_answers = totals.correct
+        FROM (
+            SELECT
+                correct,
+                CASE WHEN :gradeable > 0 THEN correct * 100.0 / :gradeable ELSE 0 END as score
+            FROM (
+                SELECT COUNT(*) as correct
+                FROM user_answers ua
+                JOIN questions q ON q.id = ua.question_id
+                WHERE ua.exam_id = :exam_id
+                AND ua.is_correct
+                AND lower(q.question_type) IN ('mcq', 'true_false')
+            )
+        ) AS totals
+        WHERE results.id = :exam_id
+        RETURNING score, grade, correct_answers
+    """, {"gradeable": gradeable_questions, "exam_id": exam_id}).fetchone()
+    return exam_id, final, detailed_results
+
+def write_exam_batch(conn: sqlite3.Connection, batch: list) -> None:
+    """Insert a batch of queued submissions in one transaction and resolve their futures"""
+    outcomes = []
+    try:
+        conn.execute("BEGIN")
+        for *submission, future in batch:
+            # A savepoint per submission, so one bad submission fails alone
+            conn.execute("SAVEPOINT submission")
+            try:
+                outcomes.append((future, insert_graded_exam(conn.cursor(), *submission), None))
+                conn.execute("RELEASE submission")
+            except Exception as e:
+                conn.execute("ROLLBACK TO submission")
+                conn.execute("RELEASE submission")
+                outcomes.append((future, None, e))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        for item in batch:
+            item[-1].set_exception(e)
+        return
+
+    for future, result, error in outcomes:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+def exam_writer_loop() -> None:
+    """Write queued exam submissions in batches. Every future is resolved,
+    since requests wait on them without a timeout."""
+    while True:
+        batch = collect_batch(exam_write_queue, EXAM_WRITE_BATCH_SIZE, EXAM_WRITE_BATCH_WINDOW)
+        try:
+            with db_pool.acquire() as conn:
+                write_exam_batch(conn, batch)
+        except Exception as e:
+            print(f"Error in exam writer: {str(e)}")
+            for item in batch:
+                if not item[-1].done():
+                    item[-1].set_exception(e)
 
 # Initialize databases on startup
 init_databases()
+threading.Thread(target=user_writer_loop, name="user-writer", daemon=True).start()
+threading.Thread(target=exam_writer_loop, name="exam-writer", daemon=True).start()
 
 # Authentication routes
+def hash_password(password: str, rounds: int) -> str:
+    """Hash a password with bcrypt (runs in a bcrypt_pool worker)"""
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+def check_password(password_hash: str, password: str) -> bool:
+    """Check a password against its bcrypt hash (runs in a bcrypt_pool worker)"""
+    return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+
 @app.route("/register", methods=["POST"])
 def register():
     """Register a new user"""
@@ -380,18 +1053,14 @@ def register():
                 "error": "Email, password, first name, and last name are required"
             }), 400
 
-        hashed_password = bcrypt.generate_password_hash(password).decode("utf-8")
+        hashed_password = bcrypt_pool.submit(hash_password, password, BCRYPT_LOG_ROUNDS).result()
 
-        conn = get_db_connection("users.db")
+        # Hand the row to the background writer and wait for its commit.
+        # No timeout: a registration that gave up would still be created.
+        future = Future()
+        user_write_queue.put((email, hashed_password, first_name, last_name, future))
         try:
-            conn.execute(
-                """
-                INSERT INTO users (email, password, first_name, last_name)
-                VALUES (?, ?, ?, ?)
-                """, 
-                (email, hashed_password, first_name, last_name)
-            )
-            conn.commit()
+            future.result()
             return jsonify({
                 "message": "User registered successfully!",
                 "user": {
@@ -401,9 +1070,7 @@ def register():
                 }
             })
         except sqlite3.IntegrityError:
-            return jsonify({"error": "Email already exists"}), 400
-        finally:
-            conn.close()
+            return error_response("Email already exists", 400)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -416,96 +1083,389 @@ def login():
         password = data.get("password")
 
         if not email or not password:
-            return jsonify({"error": "Email and password are required"}), 400
+            return error_response("Email and password are required", 400)
 
-        conn = get_db_connection("users.db")
-        try:
+        with db_pool.acquire() as conn:
             user = conn.execute(
                 "SELECT * FROM users WHERE email = ?", 
                 (email,)
             ).fetchone()
 
-            if user and bcrypt.check_password_hash(user["password"], password):
-                access_token = create_access_token(identity=email)
-                return jsonify({
-                    "token": access_token,
-                    "user": {
-                        "email": user["email"],
-                        "first_name": user["first_name"],
-                        "last_name": user["last_name"]
-                    }
-                })
-            else:
-                return jsonify({"error": "Invalid email or password"}), 401
-        finally:
-            conn.close()
+        if user and bcrypt_pool.submit(check_password, user["password"], password).result():
+            access_token = create_access_token(identity=email)
+            return jsonify({
+                "token": access_token,
+                "user": {
+                    "email": user["email"],
+                    "first_name": user["first_name"],
+                    "last_name": user["last_name"]
+                }
+            })
+        else:
+            return error_response("Invalid email or password", 401)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/protected", methods=["GET"])
-@jwt_required()
+@cached_jwt_required
 def protected():
     """Test protected route"""
     current_user = get_jwt_identity()
     return jsonify({"message": f"Welcome {current_user}!"})
 
 # Exam routes
-def extract_subject(text: str) -> str:
-    """Extract subject from text based on common subjects"""
-    subjects = [
-        # Academic subjects
-        "Mathematics", "Physics", "Chemistry", "Biology",
-        "History", "Geography", "Literature", "English",
-        # Technology subjects
-        "Python", "Java", "JavaScript", "TypeScript",
-        "React", "Angular", "Vue", "NodeJS",
-        "Database", "SQL", "MongoDB", "AWS",
-        "Docker", "Kubernetes", "DevOps", "Machine Learning",
-        "Artificial Intelligence", "Web Development",
-        "Mobile Development", "Cloud Computing",
-        "Cybersecurity", "Networking", "Data Structures",
-        "Algorithms", "Software Engineering"
-    ]
-    
-    text_lower = text.lower()
-    for subject in subjects:
-        if subject.lower() in text_lower:
-            return subject
-    return "General"
-
-def extract_question_type(text: str) -> str:
-    """Extract question type from prompt text, defaults to mcq if no match found"""
-    # Define keywords for each question type
-    type_keywords = {
-        "mcq": ["mcq", "multiple choice", "multiple-choice"],
-        "true_false": ["true false", "true/false", "true-false", "t/f"],
-        "short_answer": ["short answer", "short-answer", "brief answer"],
-        "coding": ["coding", "code", "programming"],
-        "essay": ["essay", "long answer", "written response"]
-    }
-    
-    text_lower = text.lower()
-    for q_type, keywords in type_keywords.items():
-        if any(keyword in text_lower for keyword in keywords):
-            return q_type
-    return "mcq"  # Default to mcq instead of None
-
-def extract_difficulty_level(text: str) -> str:
-    """Extract difficulty level from prompt text based on keywords"""
-    level_keywords = {
-        "basic": ["basic", "beginner", "elementary", "easy", "fundamental", "simple", "entry level", "entry-level"],
-        "intermediate": ["intermediate", "medium", "moderate", "middle", "regular"],
-        "advanced": ["advanced", "expert", "difficult", "hard", "complex", "challenging", "advanced level", "expert level"]
-    }
-    
-    text_lower = text.lower()
-    for level, keywords in level_keywords.items():
-        if any(keyword in text_lower for keyword in keywords):
-            return level
-    return "intermediate"  # Default to intermediate if no level is specified
+# Keyword tables used to classify exam prompts
+SUBJECTS = [
+    # Academic subjects
+    "Mathematics", "Physics", "Chemistry", "Biology",
+    "History", "Geography", "Literature", "English",
+    # Technology subjects
+    "Python", "Java", "JavaScript", "TypeScript",
+    "React", "Angular", "Vue", "NodeJS",
+    "Database", "SQL", "MongoDB", "AWS",
+    "Docker", "Kubernetes", "DevOps", "Machine Learning",
+    "Artificial Intelligence", "Web Development",
+    "Mobile Development", "Cloud Computing",
+    "Cybersecurity", "Networking", "Data Structures",
+    "Algorithms", "Software Engineering"
+]
+
+QUESTION_TYPE_KEYWORDS = {
+    "mcq": ["mcq", "multiple choice", "multiple-choice"],
+    "true_false": ["true false", "true/false", "true-false", "t/f"],
+    "short_answer": ["short answer", "short-answer", "brief answer"],
+    "coding": ["coding", "code", "programming"],
+    "essay": ["essay", "long answer", "written response"]
+}
+
+DIFFICULTY_LEVEL_KEYWORDS = {
+    "basic": ["basic", "beginner", "elementary", "easy", "fundamental", "simple", "entry level", "entry-level"],
+    "intermediate": ["intermediate", "medium", "moderate", "middle", "regular"],
+    "advanced": ["advanced", "expert", "difficult", "hard", "complex", "challenging", "advanced level", "expert level"]
+}
+
+# Fallbacks for categories the prompt does not mention
+CLASSIFY_DEFAULTS = {
+    "subject": "General",
+    "question_type": "mcq",
+    "level": "intermediate"
+}
+
+def build_keyword_map() -> Dict[str, tuple]:
+    """Map every lowercase keyword to its (category, canonical value, priority).
+
+    Priority is the canonical value's position in SUBJECTS,
+    QUESTION_TYPE_KEYWORDS or DIFFICULTY_LEVEL_KEYWORDS; lower wins.
+    """
+    keyword_map = {subject.lower(): ("subject", subject, rank) for rank, subject in enumerate(SUBJECTS)}
+    for rank, (q_type, keywords) in enumerate(QUESTION_TYPE_KEYWORDS.items()):
+        keyword_map.update({keyword: ("question_type", q_type, rank) for keyword in keywords})
+    for rank, (level, keywords) in enumerate(DIFFICULTY_LEVEL_KEYWORDS.items()):
+        keyword_map.update({keyword: ("level", level, rank) for keyword in keywords})
+    return keyword_map
+
+KEYWORD_MAP = build_keyword_map()
+
+# One alternation over every keyword, longest first, wrapped in a lookahead
+# so a match is reported at every position; at each position the longest
+# keyword wins (e.g. "javascript" over "java")
+KEYWORD_PATTERN = re.compile(
+    "(?=(" + "|".join(
+        re.escape(keyword) for keyword in sorted(KEYWORD_MAP, key=len, reverse=True)
+    ) + "))"
+)
+
+def classify(text: str) -> tuple:
+    """Classify prompt text into (subject, question_type, level) in a single scan.
+
+    Overlapping keywords resolve to the longest one; among separate matches
+    the value listed first in its category wins, as with the original
+    per-category keyword checks. Unmatched categories fall back to
+    CLASSIFY_DEFAULTS.
+    """
+    matches = {}
+    matched_until = 0
+    for match in KEYWORD_PATTERN.finditer(text.lower()):
+        if match.start() < matched_until:
+            # Inside a longer keyword that was already counted
+            continue
+        keyword = match.group(1)
+        matched_until = match.start() + len(keyword)
+        category, canonical, priority = KEYWORD_MAP[keyword]
+        if category not in matches or priority < matches[category][0]:
+            matches[category] = (priority, canonical)
+
+    return tuple(
+        matches[category][1] if category in matches else CLASSIFY_DEFAULTS[category]
+        for category in ("subject", "question_type", "level")
+    )
+
+# Prompt templates parsed once at import; filled per request with format_map
+PROMPT_TEMPLATE = """
+        Generate {level_upper} level {question_type_upper} questions for the subject '{subject}' based on the prompt:
+        '{prompt}'
+
+        Difficulty Level: {level}
+        {level_rules}
+
+        Follow these strict rules for the {question_type} type:
+        {type_rules}
+
+        Each question must be a dictionary with:
+        - 'id': unique question ID
+        - 'question': clear, well-formed question text
+        - 'type': "{question_type}"
+        - 'level': "{level}"
+        {type_fields}
+        - 'hint': specific, helpful hint that guides without giving away the answer
+        - 'time_limit': time in seconds (default {time_limit})
+        - 'subject': "{subject}"
+
+        Format the response as a JSON array of question objects without Markdown formatting.
+        """.replace("{time_limit}", str(DEFAULT_TIME_LIMIT))  # constant, so baked in at import
+
+SYSTEM_PROMPT_TEMPLATE = "You are an expert {question_type} question generator specializing in {level} level questions. Generate only {level} {question_type} questions following the specified format."
+
+@lru_cache(maxsize=None)
+def get_system_prompt(question_type: str, level: str) -> str:
+    """System prompt for a question type and level; there are only a handful of combinations"""
+    return SYSTEM_PROMPT_TEMPLATE.format(question_type=question_type, level=level)
+
+# Coalescing of question generation requests into shared API calls
+GENERATION_BATCH_SIZE = 8
+GENERATION_BATCH_WINDOW = 0.05  # seconds
+GENERATION_MAX_TOKENS = 800  # per question set
+GENERATION_TEMPERATURE = 0.7
+GENERATION_WORKERS = 4
+# Upper bound on how long a request waits for its question set. The
+# coalescer spends no longer than this on a batch: every attempt, retry and
+# single-call fallback is fitted into the time left before the deadline.
+GENERATION_WAIT_TIMEOUT = 180  # seconds
+generation_queue: "queue.Queue[tuple]" = queue.Queue()
+generation_pool = ThreadPoolExecutor(max_workers=GENERATION_WORKERS, thread_name_prefix="generation")
+
+BATCH_SYSTEM_PROMPT = "You are an expert exam question generator. Each request below has its own instructions; follow each one independently."
+
+BATCH_PROMPT_HEADER = "Generate {count} independent question sets, one per request below. Return a top-level JSON array with exactly {count} elements, where element N is the JSON array of question objects for Request N. Do not use Markdown formatting."
+# Batching puts several users' prompts into one message, so one user's prompt
+# can steer or echo another's request. Each returned set is therefore checked
+# against its own request's subject, type and level (batched_set_matches),
+# and any set that does not match is regenerated with a dedicated call.
+
+JSON_FENCE_PATTERN = re.compile(r"```json\n(.*?)\n```", re.DOTALL)
+
+def parse_questions_response(response_text: str) -> Any:
+    """Strip an optional ```json fence and parse the model's JSON output"""
+    clean_json = response_text.strip()
+    # Only fenced responses need the regex scan, and a response that is
+    # exactly one ```json fence is sliced without it
+    if clean_json.startswith("```json\n") and clean_json.endswith("\n```"):
+        clean_json = clean_json[len("```json\n"):-len("\n```")]
+    elif clean_json.startswith("```"):
+        match = JSON_FENCE_PATTERN.search(clean_json)
+        if match:
+            clean_json = match.group(1)
+    return orjson.loads(clean_json)
+
+def generation_timeout(max_tokens: int) -> float:
+    """Per-attempt timeout in seconds, scaled with the completion budget"""
+    return 10 + max_tokens / 50
+
+def generation_client(deadline: float, attempt_timeout: float, reserve: float = 0) -> openai.AzureOpenAI:
+    """The shared client with its per-attempt timeout and retries cut down to
+    the time left before deadline, keeping reserve seconds for a fallback"""
+    remaining = deadline - time.monotonic() - reserve
+    if remaining <= 0:
+        raise TimeoutError("Question generation ran out of time")
+    timeout = min(attempt_timeout, remaining)
+    max_retries = min(OPENAI_MAX_RETRIES, int(remaining // timeout) - 1)
+    return openai_client.with_options(timeout=timeout, max_retries=max_retries)
+
+def generate_question_set(system_prompt: str, user_prompt: str, scope: tuple, deadline: float) -> list:
+    """Generate and validate one question set with a dedicated API call"""
+    throttle_openai([system_prompt, user_prompt], GENERATION_MAX_TOKENS)
+    client = generation_client(deadline, generation_timeout(GENERATION_MAX_TOKENS))
+    response = client.chat.completions.create(
+        model=os.getenv("DEPLOYMENT_NAME"),
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=GENERATION_TEMPERATURE,
+        max_tokens=GENERATION_MAX_TOKENS,
+    )
+    questions = parse_questions_response(response.choices[0].message.content)
+    validate_questions(questions, scope[1], scope[2])
+    return questions
+
+def batched_set_matches(questions: Any, scope: tuple) -> bool:
+    """Whether a set from a batched reply is valid for the request it was
+    returned for, so swapped or malformed sets are regenerated on their own"""
+    subject, question_type, level = scope
+    if not isinstance(questions, list) or not questions:
+        return False
+    try:
+        validate_questions(questions, question_type, level)
+    except Exception:
+        return False
+    return all(
+        isinstance(question, dict) and str(question.get("subject", "")).lower() == subject.lower()
+        for question in questions
+    )
+
+def generate_question_sets(batch: list) -> None:
+    """Resolve a batch of queued generation requests with one API call,
+    falling back to one call per request whose set is missing or invalid"""
+    deadline = time.monotonic() + GENERATION_WAIT_TIMEOUT
+    if len(batch) > 1:
+        try:
+            requests_text = "\n\n".join(
+                f"Request {index}:\n{system_prompt}\n{user_prompt}"
+                for index, (system_prompt, user_prompt, _, _) in enumerate(batch, start=1)
+            )
+            throttle_openai([BATCH_SYSTEM_PROMPT, requests_text], GENERATION_MAX_TOKENS * len(batch))
+            # Leave enough of the budget for one single-call fallback attempt
+            client = generation_client(
+                deadline,
+                generation_timeout(GENERATION_MAX_TOKENS * len(batch)),
+                reserve=generation_timeout(GENERATION_MAX_TOKENS)
+            )
+            response = client.chat.completions.create(
+                model=os.getenv("DEPLOYMENT_NAME"),
+                messages=[
+                    {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                    {"role": "user", "content": f"{BATCH_PROMPT_HEADER.format(count=len(batch))}\n\n{requests_text}"}
+                ],
+                temperature=GENERATION_TEMPERATURE,
+                max_tokens=GENERATION_MAX_TOKENS * len(batch),
+            )
+            question_sets = parse_questions_response(response.choices[0].message.content)
+            if isinstance(question_sets, list) and len(question_sets) == len(batch):
+                remaining = []
+                for item, questions in zip(batch, question_sets):
+                    if batched_set_matches(questions, item[2]):
+                        item[3].set_result(questions)
+                    else:
+                        remaining.append(item)
+                if remaining:
+                    print(f"Batched generation returned {len(remaining)} unusable set(s), regenerating them with single calls")
+                batch = remaining
+            else:
+                print("Batched generation returned an unexpected shape, falling back to single calls")
+        except Exception as e:
+            print(f"Batched generation failed, falling back to single calls: {str(e)}")
+
+    # Fan the single calls out across the pool instead of running them back to
+    # back; each one resolves its own future, so nothing here waits on them
+    for system_prompt, user_prompt, scope, future in batch:
+        generation_pool.submit(resolve_question_set, system_prompt, user_prompt, scope, future, deadline)
+
+def resolve_question_set(system_prompt: str, user_prompt: str, scope: tuple, future: Future, deadline: float) -> None:
+    """Generate one question set and hand the outcome to the waiting request"""
+    try:
+        future.set_result(generate_question_set(system_prompt, user_prompt, scope, deadline))
+    except Exception as e:
+        future.set_exception(e)
+
+def generation_loop() -> None:
+    """Hand batches of queued generation requests to the generation pool"""
+    while True:
+        batch = collect_batch(generation_queue, GENERATION_BATCH_SIZE, GENERATION_BATCH_WINDOW)
+        generation_pool.submit(generate_question_sets, batch)
+
+threading.Thread(target=generation_loop, name="generation-batcher", daemon=True).start()
+
+# Exact-match cache of question sets, shared by all workers through Redis
+PROMPT_CACHE_TTL = 600  # seconds
+# Without Redis, question sets are cached per process instead
+PROMPT_CACHE_SIZE = 1000
+local_prompt_cache = TTLCache(PROMPT_CACHE_SIZE, PROMPT_CACHE_TTL)
+
+def prompt_cache_key(system_prompt: str, user_prompt: str) -> str:
+    """Key a generation request by everything that determines its output"""
+    digest = hashlib.sha256(
+        f"{os.getenv('DEPLOYMENT_NAME')}|{GENERATION_TEMPERATURE}|{system_prompt}|{user_prompt}".encode("utf-8")
+    ).digest()
+    return f"gen:{digest[:16].hex()}"
+
+def prompt_cache_get(key: str) -> Optional[list]:
+    """Return the question set cached for a prompt key, or None"""
+    if redis_client is None:
+        return local_prompt_cache.get(key)
+    cached = cache_get(key)
+    return orjson.loads(cached) if cached else None
+
+def prompt_cache_set(key: str, questions: list) -> None:
+    """Cache the question set generated for a prompt key"""
+    if redis_client is None:
+        local_prompt_cache.set(key, questions)
+        return
+    cache_set(key, orjson.dumps(questions), PROMPT_CACHE_TTL)
+
+# Semantic cache: prompts whose embeddings are close enough to an earlier
+# prompt for the same subject/type/level reuse that prompt's question set
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_SIZE = 512
+# Lookups scan one scope's entries in pure Python while holding the GIL, so
+# both the per-scope count and the vector width are kept small
+SEMANTIC_CACHE_SCOPE_SIZE = 32
+SEMANTIC_CACHE_DIMENSIONS = 256
+SEMANTIC_CACHE_TTL = 3600  # seconds
+
+class SemanticCache:
+    """Bounded, expiring store of (prompt embedding, questions) pairs searched by cosine similarity"""
+
+    def __init__(self, size: int, scope_size: int, ttl: float, threshold: float):
+        self.size = size
+        self.scope_size = scope_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.entries = []  # (scope, unit vector, questions, expires_at), oldest first
+        self.lock = threading.Lock()
+
+    def lookup(self, scope: tuple, vector: list) -> Optional[list]:
+        now = time.monotonic()
+        best, best_similarity = None, self.threshold
+        with self.lock:
+            self.entries = [entry for entry in self.entries if entry[3] > now]
+            candidates = [entry for entry in self.entries if entry[0] == scope]
+        for _, cached_vector, questions, _ in candidates:
+            # Both vectors are unit length, so the dot product is the cosine
+            similarity = sum(map(operator.mul, vector, cached_vector))
+            if similarity >= best_similarity:
+                best, best_similarity = questions, similarity
+        return best
+
+    def store(self, scope: tuple, vector: list, questions: list) -> None:
+        with self.lock:
+            in_scope = [index for index, entry in enumerate(self.entries) if entry[0] == scope]
+            if len(in_scope) >= self.scope_size:
+                del self.entries[in_scope[0]]
+            self.entries.append((scope, vector, questions, time.monotonic() + self.ttl))
+            del self.entries[:-self.size]
+
+semantic_cache = SemanticCache(
+    SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_SCOPE_SIZE, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_THRESHOLD
+)
+
+def embed_prompt(prompt: str) -> Optional[list]:
+    """Unit-length embedding of a prompt, or None when the embeddings call fails"""
+    try:
+        throttle_openai([prompt])
+        response = openai_client.embeddings.create(
+            model=EMBEDDING_DEPLOYMENT_NAME,
+            input=[prompt],
+            dimensions=SEMANTIC_CACHE_DIMENSIONS
+        )
+        vector = response.data[0].embedding
+    except Exception as e:
+        print(f"Warning: Prompt embedding failed, skipping semantic cache: {str(e)}")
+        return None
+    norm = sum(x * x for x in vector) ** 0.5
+    return [x / norm for x in vector] if norm else None
 
 @app.route("/generate_questions", methods=["POST"])
-@jwt_required()
+@cached_jwt_required
 def generate_questions():
     """Generate exam questions using Azure OpenAI"""
     try:
@@ -518,54 +1478,45 @@ def generate_questions():
                 "error": "Prompt is required. Please provide a detailed prompt including subject, question type, and difficulty level."
             }), 400
 
-        # Extract subject, question type, and difficulty level from prompt
-        subject = extract_subject(prompt)
-        question_type = extract_question_type(prompt)
-        difficulty_level = extract_difficulty_level(prompt)
+        # Classify subject, question type, and difficulty level from prompt
+        subject, question_type, difficulty_level = classify(prompt)
         
-        formatted_prompt = f"""
-        Generate {difficulty_level.upper()} level {question_type.upper()} questions for the subject '{subject}' based on the prompt:
-        '{prompt}'
+        formatted_prompt = PROMPT_TEMPLATE.format_map({
+            "prompt": prompt,
+            "subject": subject,
+            "question_type": question_type,
+            "question_type_upper": question_type.upper(),
+            "level": difficulty_level,
+            "level_upper": difficulty_level.upper(),
+            "level_rules": get_level_specific_rules(difficulty_level),
+            "type_rules": get_question_type_rules(question_type),
+            "type_fields": get_type_specific_fields(question_type)
+        })
+        print(f"Generating questions with level: {difficulty_level}")
 
-        Difficulty Level: {difficulty_level}
-        {get_level_specific_rules(difficulty_level)}
+        system_prompt = get_system_prompt(question_type, difficulty_level)
+        cache_key = prompt_cache_key(system_prompt, formatted_prompt)
+        questions_json = prompt_cache_get(cache_key)
 
-        Follow these strict rules for the {question_type} type:
-        {get_question_type_rules(question_type)}
+        if questions_json is None:
+            scope = (subject, question_type, difficulty_level)
+            prompt_vector = embed_prompt(prompt)
+            questions_json = semantic_cache.lookup(scope, prompt_vector) if prompt_vector else None
 
-        Each question must be a dictionary with:
-        - 'id': unique question ID
-        - 'question': clear, well-formed question text
-        - 'type': "{question_type}"
-        - 'level': "{difficulty_level}"
-        {get_type_specific_fields(question_type)}
-        - 'hint': specific, helpful hint that guides without giving away the answer
-        - 'time_limit': time in seconds (default {DEFAULT_TIME_LIMIT})
-        - 'subject': "{subject}"
+            if questions_json is None:
+                # Queue the request; concurrent requests share one API call.
+                # The generation workers validate the set before resolving it.
+                future = Future()
+                generation_queue.put((system_prompt, formatted_prompt, scope, future))
+                questions_json = future.result(timeout=GENERATION_WAIT_TIMEOUT)
 
-        Format the response as a JSON array of question objects without Markdown formatting.
-        """
-        print(f"Generating questions with level: {difficulty_level}")
-        
-        response = openai_client.chat.completions.create(
-            model=os.getenv("DEPLOYMENT_NAME"),
-            messages=[
-                {
-                    "role": "system", 
-                    "content": f"You are an expert {question_type} question generator specializing in {difficulty_level} level questions. Generate only {difficulty_level} {question_type} questions following the specified format."
-                },
-                {"role": "user", "content": formatted_prompt}
-            ],
-            temperature=0.7,
-            max_tokens=800,
-        )
+                if prompt_vector:
+                    semantic_cache.store(scope, prompt_vector, questions_json)
 
-        response_text = response.choices[0].message.content.strip()
-        clean_json = re.sub(r"```json\n(.*?)\n```", r"\1", response_text, flags=re.DOTALL)
-        questions_json = json.loads(clean_json)
+            prompt_cache_set(cache_key, questions_json)
 
-        # Validate questions
-        validate_questions(questions_json, question_type, difficulty_level)
+        record_question_start_times(user_id, [q["id"] for q in questions_json if "id" in q])
+        save_exam_state(user_id, questions_json, subject)
 
         return jsonify({
             "questions": questions_json,
@@ -575,10 +1526,13 @@ def generate_questions():
         })
 
     except json.JSONDecodeError:
-        return jsonify({"error": "Invalid JSON format received from OpenAI"}), 500
+        return error_response("Invalid JSON format received from OpenAI", 500)
+    except TimeoutError:
+        return error_response("Question generation timed out", 504)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@lru_cache(maxsize=None)
 def get_question_type_rules(q_type: str) -> str:
     """Get specific rules for each question type"""
     rules = {
@@ -631,6 +1585,7 @@ def get_question_type_rules(q_type: str) -> str:
     }
     return rules.get(q_type, "Follow standard question format rules.")
 
+@lru_cache(maxsize=None)
 def get_type_specific_fields(q_type: str) -> str:
     """Get required fields based on question type"""
     fields = {
@@ -819,345 +1774,926 @@ def get_question_examples(q_type: str, subject: str = None) -> dict:
         return examples[q_type].get(subject.lower(), examples[q_type].get("general", []))
     return examples.get(q_type, [])
 
-def evaluate_essay(question: str, correct_answer: str, user_answer: str) -> dict:
-    """Evaluate essay answers using OpenAI"""
-    prompt = f"""
-    Evaluate this essay response based on the following criteria:
-    Question: {question}
-    Model Answer: {correct_answer}
-    Student's Answer: {user_answer}
-
-    Please analyze:
-    1. Content relevance (0-100)
-    2. Accuracy of information (0-100)
-    3. Clarity and organization (0-100)
-    4. Grammar and language (0-100)
-
-    Return a JSON with:
-    - Individual scores for each criterion
-    - Overall score (weighted average)
-    - Specific feedback for improvement
-    - Key points covered and missed
+EVALUATION_TEMPERATURE = 0.3
+EVALUATION_MAX_TOKENS = 500
+
+# Fixed rubrics are sent as byte-identical system messages so the prompt
+# prefix can be served from OpenAI's prompt cache
+ESSAY_RUBRIC_SYSTEM = """You are an expert essay evaluator.
+Evaluate the student's essay response against the question and model answer based on the following criteria:
+1. Content relevance (0-100)
+2. Accuracy of information (0-100)
+3. Clarity and organization (0-100)
+4. Grammar and language (0-100)
+
+Return a JSON object with:
+- "scores": individual scores for each criterion
+- "overall_score": overall score (weighted average)
+- "feedback": specific feedback for improvement
+- "key_points_covered" and "key_points_missed": key points covered and missed"""
+
+CODE_RUBRIC_SYSTEM = """You are an expert code reviewer.
+Evaluate the student's code solution against the question and model solution based on the following:
+1. Correctness (0-100)
+2. Code efficiency (0-100)
+3. Code style and readability (0-100)
+4. Error handling (0-100)
+
+Return a JSON object with:
+- "scores": scores for each criterion
+- "overall_score": overall score
+- "feedback": specific feedback
+- "suggested_improvements": suggested improvements"""
+
+def essay_evaluation_messages(question: str, correct_answer: str, user_answer: str) -> list:
+    """Build the chat messages used to evaluate an essay answer"""
+    return [
+        {"role": "system", "content": ESSAY_RUBRIC_SYSTEM},
+        {"role": "user", "content": f"Question: {question}\nModel Answer: {correct_answer}\nStudent's Answer: {user_answer}"}
+    ]
+
+def code_evaluation_messages(question: str, correct_answer: str, user_answer: str) -> list:
+    """Build the chat messages used to evaluate a coding answer"""
+    return [
+        {"role": "system", "content": CODE_RUBRIC_SYSTEM},
+        {"role": "user", "content": f"Question: {question}\nModel Solution: {correct_answer}\nStudent's Solution: {user_answer}"}
+    ]
+
+EVALUATION_MESSAGE_BUILDERS = {
+    "essay": essay_evaluation_messages,
+    "coding": code_evaluation_messages
+}
+
+def failed_evaluation(error: Exception) -> dict:
+    """Evaluation recorded when automatic grading fails"""
+    return {
+        "error": f"Evaluation failed: {str(error)}",
+        "overall_score": 0,
+        "feedback": "Automatic evaluation failed. Please review manually."
+    }
+
+# Bump whenever the evaluation prompts change so cached evaluations expire
+EVALUATION_PROMPT_VERSION = 2
+
+def essay_cache_answer(user_answer: str) -> str:
+    """Essays are graded on content, so case and surrounding whitespace do not change the key"""
+    return str(user_answer).strip().lower()
+
+def code_cache_answer(user_answer: str) -> str:
+    """Code is case-sensitive; only surrounding whitespace is ignored"""
+    return str(user_answer).strip()
+
+def llm_cached(normalize_answer, cache_name: Optional[str] = None):
+    """Serve repeated (question, model answer, student answer) evaluations
+    from the eval_cache table instead of calling OpenAI again.
+
+    normalize_answer maps the student answer to the form used in the key;
+    cache_name (default: the evaluator's name) lets two evaluators of the
+    same kind of answer share cache entries.
+    """
+    def decorator(evaluator):
+        @wraps(evaluator)
+        def wrapper(question: str, correct_answer: str, user_answer: str) -> dict:
+            key = hashlib.sha256(
+                f"{cache_name or evaluator.__name__}|{os.getenv('DEPLOYMENT_NAME')}|{EVALUATION_PROMPT_VERSION}|"
+                f"{question}|{correct_answer}|{normalize_answer(user_answer)}".encode("utf-8")
+            ).hexdigest()
+
+            with db_pool.acquire() as conn:
+                cached = conn.execute(
+                    "SELECT evaluation_json FROM eval_cache WHERE key = ?",
+                    (key,)
+                ).fetchone()
+            if cached:
+                return orjson.loads(cached["evaluation_json"])
+
+            evaluation = evaluator(question, correct_answer, user_answer)
+
+            # Failed evaluations are retried next time rather than cached
+            if "error" not in evaluation:
+                try:
+                    with db_pool.acquire() as conn:
+                        conn.execute(
+                            "INSERT OR IGNORE INTO eval_cache (key, evaluation_json) VALUES (?, ?)",
+                            (key, orjson.dumps(evaluation).decode("utf-8"))
+                        )
+                except Exception as e:
+                    print(f"Warning: Could not cache evaluation: {str(e)}")
+            return evaluation
+        return wrapper
+    return decorator
+
+EVALUATION_RESPONSE_FORMAT = {"type": "json_object"}
+OVERALL_SCORE_PATTERN = re.compile(r'"overall_score"\s*:\s*(\d+(?:\.\d+)?)')
+EVALUATION_FENCE_PATTERN = re.compile(r"```(?:json)?\n?(.*?)\n?```", re.DOTALL)
+JSON_DECODER = json.JSONDecoder()
+
+def parse_evaluation(text: str) -> dict:
+    """Parse an evaluation JSON object from model output.
+
+    Tolerates SSE "data: " prefixes, a trailing "data: [DONE]", Markdown
+    fences and text around the object. Truncated output keeps any
+    overall_score emitted before the cut and is flagged with an error so it
+    is not cached.
     """
+    lines = []
+    for line in text.strip().splitlines():
+        if line.startswith("data: "):
+            line = line[len("data: "):]
+        if line.strip() != "[DONE]":
+            lines.append(line)
+    cleaned = "\n".join(lines)
+    if "```" in cleaned:
+        cleaned = EVALUATION_FENCE_PATTERN.sub(r"\1", cleaned)
+
+    start = cleaned.find("{")
+    if start != -1:
+        try:
+            evaluation, _ = JSON_DECODER.raw_decode(cleaned[start:])
+            if isinstance(evaluation, dict):
+                return evaluation
+        except json.JSONDecodeError:
+            pass
+
+    partial = {
+        "error": "Incomplete evaluation response",
+        "overall_score": 0,
+        "feedback": "Partial response"
+    }
+    match = OVERALL_SCORE_PATTERN.search(cleaned)
+    if match:
+        partial["overall_score"] = float(match.group(1))
+    return partial
 
+def request_evaluation(messages: list) -> dict:
+    """Stream an evaluation from OpenAI and parse it when the stream ends"""
     try:
-        response = openai_client.chat.completions.create(
+        throttle_openai([message["content"] for message in messages], EVALUATION_MAX_TOKENS)
+        stream = openai_client.chat.completions.create(
             model=os.getenv("DEPLOYMENT_NAME"),
-            messages=[
-                {"role": "system", "content": "You are an expert essay evaluator."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=500
+            messages=messages,
+            temperature=EVALUATION_TEMPERATURE,
+            max_tokens=EVALUATION_MAX_TOKENS,
+            response_format=EVALUATION_RESPONSE_FORMAT,
+            stream=True
         )
-        
-        evaluation = json.loads(response.choices[0].message.content)
-        return evaluation
+
+        # Azure sends content-filter chunks without choices; skip those
+        chunks = []
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                chunks.append(chunk.choices[0].delta.content)
+        return parse_evaluation("".join(chunks))
     except Exception as e:
-        return {
-            "error": f"Evaluation failed: {str(e)}",
-            "overall_score": 0,
-            "feedback": "Automatic evaluation failed. Please review manually."
-        }
+        return failed_evaluation(e)
+
+# Short essays are scored by embedding similarity to the model answer
+# instead of a full chat completion
+EMBEDDING_DEPLOYMENT_NAME = os.getenv("EMBEDDING_DEPLOYMENT_NAME", "text-embedding-3-small")
+SHORT_ESSAY_WORD_LIMIT = 150
+
+def is_short_essay(user_answer: str) -> bool:
+    return 0 < len(str(user_answer).split()) < SHORT_ESSAY_WORD_LIMIT
 
+def cosine_similarity(a: list, b: list) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = sum(x * x for x in a) ** 0.5
+    norm_b = sum(y * y for y in b) ** 0.5
+    return dot / (norm_a * norm_b) if norm_a and norm_b else 0.0
+
+def evaluate_short_essays(pairs: list) -> list:
+    """Score (correct_answer, user_answer) pairs with one embeddings call.
+
+    Returns None when the embeddings request fails so callers can fall back
+    to chat evaluation.
+    """
+    try:
+        texts = [str(text) for pair in pairs for text in pair]
+        throttle_openai(texts)
+        response = openai_client.embeddings.create(model=EMBEDDING_DEPLOYMENT_NAME, input=texts)
+        vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    except Exception as e:
+        print(f"Warning: Embedding evaluation failed: {str(e)}")
+        return None
+
+    evaluations = []
+    for i in range(len(pairs)):
+        similarity = cosine_similarity(vectors[2 * i], vectors[2 * i + 1])
+        evaluations.append({
+            "overall_score": int(max(0.0, similarity) * 100),
+            "feedback": "Similarity-based"
+        })
+    return evaluations
+
+@llm_cached(essay_cache_answer)
+def evaluate_essay(question: str, correct_answer: str, user_answer: str) -> dict:
+    """Evaluate essay answers using OpenAI"""
+    if is_short_essay(user_answer):
+        evaluations = evaluate_short_essays([(correct_answer, user_answer)])
+        if evaluations:
+            return evaluations[0]
+    return request_evaluation(essay_evaluation_messages(question, correct_answer, user_answer))
+
+@llm_cached(essay_cache_answer, cache_name="evaluate_essay")
+def evaluate_essay_with_chat(question: str, correct_answer: str, user_answer: str) -> dict:
+    """Evaluate an essay with a chat completion only, for short essays whose
+    embeddings scoring already failed; shares evaluate_essay's cache entries"""
+    return request_evaluation(essay_evaluation_messages(question, correct_answer, user_answer))
+
+@llm_cached(code_cache_answer)
 def evaluate_code(question: str, correct_answer: str, user_answer: str) -> dict:
     """Evaluate coding answers"""
-    prompt = f"""
-    Evaluate this code solution based on the following:
-    Question: {question}
-    Model Solution: {correct_answer}
-    Student's Solution: {user_answer}
-
-    Analyze:
-    1. Correctness (0-100)
-    2. Code efficiency (0-100)
-    3. Code style and readability (0-100)
-    4. Error handling (0-100)
-
-    Return a JSON with:
-    - Scores for each criterion
-    - Overall score
-    - Specific feedback
-    - Suggested improvements
+    return request_evaluation(code_evaluation_messages(question, correct_answer, user_answer))
+
+# OpenAI Batch API grading for bulk and offline re-grading
+BATCH_ENDPOINT = "/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+# Batch statuses that end a job without results; the exam goes back to the
+# status it had before the batch was submitted
+BATCH_FAILED_STATUSES = ("failed", "expired", "cancelled")
+# An exam is claimed ("In Progress" with no batch_id yet) while its batch job
+# is created. A claim this old was left by a process that died in between,
+# so the exam may be submitted again.
+BATCH_CLAIM_TIMEOUT = 300  # seconds
+
+def batch_in_progress(status: str, batch_id: Optional[str], claimed_at: Optional[float]) -> bool:
+    """Whether an exam has a live batch job or a fresh claim on one"""
+    if status != "In Progress":
+        return False
+    return batch_id is not None or (claimed_at or 0) > time.time() - BATCH_CLAIM_TIMEOUT
+
+def grade_exam_batch(exam_id: int) -> str:
+    """Submit every essay/coding answer of an exam as one OpenAI batch job.
+
+    Each JSONL line carries custom_id "<exam_id>:<question_id>" so results can
+    be matched back when the batch completes. Returns the batch id, which is
+    stored on the results row while the exam is "In Progress". Raises
+    ValueError if the exam already has a batch in progress.
     """
+    with db_pool.acquire() as conn:
+        rows = conn.execute("""
+            SELECT
+                q.id,
+                q.question_text,
+                lower(q.question_type) as type,
+                q.correct_answer,
+                ua.answer
+            FROM questions q
+            JOIN user_answers ua ON q.id = ua.question_id
+            WHERE ua.exam_id = ? AND lower(q.question_type) IN ('essay', 'coding')
+            ORDER BY q.id
+        """, (exam_id,)).fetchall()
+
+    if not rows:
+        raise ValueError("Exam has no essay or coding answers to grade")
+
+    # Claim the exam before paying for a batch so concurrent submits cannot
+    # both create one; a stale claim (see BATCH_CLAIM_TIMEOUT) is taken over
+    # and keeps the status from before it
+    now = time.time()
+    with db_pool.acquire() as conn:
+        claimed = conn.execute("""
+            UPDATE results
+            SET pre_batch_status = CASE WHEN status = :status THEN pre_batch_status ELSE status END,
+                status = :status, batch_id = NULL, batch_status = NULL, batch_claimed_at = :now
+            WHERE id = :exam_id AND (
+                status != :status
+                OR (batch_id IS NULL AND COALESCE(batch_claimed_at, 0) <= :stale_before)
+            )
+        """, {"status": "In Progress", "now": now, "exam_id": exam_id, "stale_before": now - BATCH_CLAIM_TIMEOUT})
+    if not claimed.rowcount:
+        raise ValueError("Batch grading is already in progress for this exam")
+
+    deployment = os.getenv("BATCH_DEPLOYMENT_NAME", os.getenv("DEPLOYMENT_NAME"))
+    lines = [orjson.dumps({
+        "custom_id": f"{exam_id}:{row['id']}",
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": deployment,
+            "messages": EVALUATION_MESSAGE_BUILDERS[row["type"]](
+                row["question_text"], row["correct_answer"] or "", row["answer"] or ""
+            ),
+            "temperature": EVALUATION_TEMPERATURE,
+            "max_tokens": EVALUATION_MAX_TOKENS,
+            "response_format": EVALUATION_RESPONSE_FORMAT
+        }
+    }) for row in rows]
 
     try:
-        response = openai_client.chat.completions.create(
-            model=os.getenv("DEPLOYMENT_NAME"),
-            messages=[
-                {"role": "system", "content": "You are an expert code reviewer."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=500
+        batch_file = openai_client.files.create(
+            file=(f"exam-{exam_id}.jsonl", b"\n".join(lines)),
+            purpose="batch"
         )
-        
-        evaluation = json.loads(response.choices[0].message.content)
-        return evaluation
-    except Exception as e:
-        return {
-            "error": f"Evaluation failed: {str(e)}",
-            "overall_score": 0,
-            "feedback": "Automatic evaluation failed. Please review manually."
+        batch = openai_client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW
+        )
+    except Exception:
+        restore_pre_batch_status(exam_id, None)
+        raise
+
+    with db_pool.acquire() as conn:
+        conn.execute("""
+            UPDATE results
+            SET batch_id = ?, batch_status = ?
+            WHERE id = ?
+        """, (batch.id, batch.status, exam_id))
+
+    return batch.id
+
+def restore_pre_batch_status(exam_id: int, batch_status: Optional[str]) -> None:
+    """Take an exam out of "In Progress" after its batch could not be graded"""
+    with db_pool.acquire() as conn:
+        conn.execute("""
+            UPDATE results
+            SET status = COALESCE(pre_batch_status, ?), batch_status = ?
+            WHERE id = ? AND status = ?
+        """, ("Completed", batch_status, exam_id, "In Progress"))
+
+def apply_exam_batch(exam_id: int, batch_id: str) -> str:
+    """Store the evaluations of a finished batch job and finalize the exam.
+
+    Returns the batch status; evaluations are only applied once it is
+    "completed". A failed, expired or cancelled batch puts the exam back to
+    its previous status so it is not polled again.
+    """
+    batch = openai_client.batches.retrieve(batch_id)
+    if batch.status in BATCH_FAILED_STATUSES:
+        restore_pre_batch_status(exam_id, batch.status)
+        return batch.status
+    if batch.status != "completed":
+        return batch.status
+
+    # Successful requests land in the output file, failed ones in the error file
+    lines = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            lines.extend(openai_client.files.content(file_id).text.splitlines())
+
+    detailed_rows = []
+    answer_rows = []
+    for line in lines:
+        if not line.strip():
+            continue
+        item = orjson.loads(line)
+        question_id = int(item["custom_id"].split(":", 1)[1])
+        try:
+            body = item["response"]["body"]
+            evaluation = parse_evaluation(body["choices"][0]["message"]["content"])
+        except Exception as e:
+            evaluation = failed_evaluation(item.get("error") or e)
+
+        score = evaluation.get("overall_score", 0)
+        detailed_rows.append((
+            exam_id, question_id, score,
+            evaluation.get("feedback"), orjson.dumps(evaluation).decode("utf-8")
+        ))
+        answer_rows.append((1 if score == 100 else 0, exam_id, question_id))
+
+    with db_pool.acquire() as conn:
+        try:
+            conn.execute("BEGIN")
+            conn.executemany("""
+                UPDATE user_answers
+                SET is_correct = ?
+                WHERE exam_id = ? AND question_id = ?
+            """, answer_rows)
+            conn.executemany("""
+                DELETE FROM results_detailed
+                WHERE exam_id = ? AND question_id = ?
+            """, [(row[0], row[1]) for row in detailed_rows])
+            conn.executemany("""
+                INSERT INTO results_detailed (
+                    exam_id, question_id, score, feedback,
+                    evaluation_data
+                ) VALUES (?, ?, ?, ?, ?)
+            """, detailed_rows)
+
+            # Same scoring as validate_answers: MCQ/true-false answers count as
+            # correct, essay/coding answers count towards the total
+            counts = conn.execute("""
+                SELECT
+                    SUM(CASE WHEN lower(q.question_type) IN ('mcq', 'true_false') AND ua.is_correct THEN 1 ELSE 0 END) as correct,
+                    SUM(CASE WHEN lower(q.question_type) IN ('mcq', 'true_false', 'essay', 'coding') THEN 1 ELSE 0 END) as gradeable
+                FROM questions q
+                JOIN user_answers ua ON q.id = ua.question_id
+                WHERE ua.exam_id = ?
+            """, (exam_id,)).fetchone()
+            correct_count = counts["correct"] or 0
+            total_gradeable_questions = counts["gradeable"] or 0
+            final_score = (correct_count / total_gradeable_questions * 100) if total_gradeable_questions > 0 else 0
+
+            # Keep the kind of status the exam had before the batch: exams
+            # saved by /submit_exam are Passed/Failed on the new score, the
+            # rest go back to their own status
+            pre_batch_status = conn.execute(
+                "SELECT pre_batch_status FROM results WHERE id = ?", (exam_id,)
+            ).fetchone()[0]
+            if pre_batch_status in PASS_STATUSES:
+                final_status = calculate_pass_status(final_score)
+            else:
+                final_status = pre_batch_status or "Completed"
+
+            # Only the first poll to see the finished batch applies it
+            updated = conn.execute("""
+                UPDATE results 
+                SET score = ?, grade = ?, status = ?, correct_answers = ?, batch_status = ?
+                WHERE id = ? AND status = ?
+            """, (
+                final_score, calculate_grade(final_score), final_status, correct_count,
+                batch.status, exam_id, "In Progress"
+            ))
+            if updated.rowcount:
+                conn.commit()
+            else:
+                conn.rollback()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return batch.status
+
+# Evaluators for question types graded by OpenAI
+EVALUATORS = {
+    "essay": evaluate_essay,
+    "coding": evaluate_code
+}
+# Evaluations spend nearly all their time waiting on OpenAI, so the shared
+# pool is sized to the HTTP client's keep-alive connections rather than to
+# CPU or web workers; one blocked request no longer limits the in-flight
+# evaluations of every other request to a handful of threads
+MAX_PARALLEL_EVALUATIONS = OPENAI_MAX_KEEPALIVE_CONNECTIONS
+# Shared across requests so worker threads are not created per exam
+EVAL_POOL = ThreadPoolExecutor(max_workers=MAX_PARALLEL_EVALUATIONS, thread_name_prefix="evaluation")
+
+def grade_submissions(user_id: str, submissions: list) -> list:
+    """Score several (questions, answers) submissions and time each question.
+
+    Essay and coding evaluations from every submission are sent to EVAL_POOL
+    together, so a batch takes as long as its slowest call rather than the sum
+    of its submissions. Returns one (graded entries, number of gradeable
+    questions) pair per submission, ready to queue for the exam writer.
+    """
+    results = []
+    evaluation_jobs = []
+    short_essay_entries = []
+
+    for questions, answers in submissions:
+        total_gradeable_questions = 0
+        graded = []
+
+        # Grade every MCQ/true-false answer in one pass up front; essay and
+        # coding answers are never normalized
+        correct_map = {
+            str(q["id"]): str(q.get("correct_answer", "")).strip().lower()
+            for q in questions if q.get("type", "").lower() in ("mcq", "true_false")
+        }
+        correctness = {
+            q_id: str(answers.get(q_id, "")).strip().lower() == correct
+            for q_id, correct in correct_map.items()
+        }
+
+        # First pass: score MCQ/true-false inline and collect essay/coding evaluations
+        for question in questions:
+            q_id = str(question["id"])
+            user_answer = answers.get(q_id, "")
+            question_type = question.get("type", "").lower()
+            entry = {
+                "question": question,
+                "user_answer": user_answer,
+                "score": 0,
+                "feedback": None,
+                "evaluation": None
+            }
+
+            if question_type in ["mcq", "true_false"]:
+                entry["score"] = 100 if correctness[q_id] else 0
+                total_gradeable_questions += 1
+            elif question_type == "essay" and is_short_essay(user_answer):
+                short_essay_entries.append(entry)
+                total_gradeable_questions += 1
+            elif question_type in EVALUATORS:
+                evaluation_jobs.append((entry, EVALUATORS[question_type]))
+                total_gradeable_questions += 1
+
+            graded.append(entry)
+
+        results.append((graded, total_gradeable_questions))
+
+    # Score all short essays with a single embeddings request; if it fails
+    # they go through chat evaluation with the rest
+    if short_essay_entries:
+        evaluations = evaluate_short_essays([
+            (entry["question"].get("correct_answer", ""), entry["user_answer"])
+            for entry in short_essay_entries
+        ])
+        if evaluations is None:
+            evaluation_jobs.extend((entry, evaluate_essay_with_chat) for entry in short_essay_entries)
+        else:
+            for entry, evaluation in zip(short_essay_entries, evaluations):
+                entry["score"] = evaluation["overall_score"]
+                entry["feedback"] = evaluation["feedback"]
+                entry["evaluation"] = evaluation
+
+    # Run the OpenAI evaluations concurrently; wall time is the slowest call
+    # rather than the sum of all of them. Identical (evaluator, question,
+    # model answer, student answer) jobs are only sent once.
+    if evaluation_jobs:
+        job_keys = [(
+            evaluator,
+            entry["question"]["question"],
+            entry["question"].get("correct_answer", ""),
+            entry["user_answer"]
+        ) for entry, evaluator in evaluation_jobs]
+        futures = {
+            EVAL_POOL.submit(job[0], *job[1:]): job
+            for job in dict.fromkeys(job_keys)
         }
+        unique_evaluations = {}
+        for future in as_completed(futures):
+            unique_evaluations[futures[future]] = future.result()
+        evaluations = [unique_evaluations[key] for key in job_keys]
+        for (entry, _), evaluation in zip(evaluation_jobs, evaluations):
+            entry["score"] = evaluation.get("overall_score", 0)
+            entry["feedback"] = evaluation.get("feedback")
+            entry["evaluation"] = evaluation
+
+    # Seconds from generation to submission, when the start was recorded
+    submitted_at = time.time()
+    all_entries = [entry for graded, _ in results for entry in graded]
+    start_times = get_question_start_times(user_id, [entry["question"]["id"] for entry in all_entries])
+    for entry in all_entries:
+        start = start_times.get(str(entry["question"]["id"]))
+        entry["time_taken"] = int(submitted_at - start) if start is not None else None
+
+    return results
+
+def grade_submission(user_id: str, questions: list, answers: dict) -> tuple:
+    """Score one submission; see grade_submissions"""
+    return grade_submissions(user_id, [(questions, answers)])[0]
 
 @app.route("/validate_answers", methods=["POST"])
-@jwt_required()
+@cached_jwt_required
 def validate_answers():
     """Validate answers and store results"""
     try:
         data = request.get_json()
         user_id = get_jwt_identity()
 
-        if not data or "answers" not in data or "questions" not in data:
-            return jsonify({"error": "Invalid request format"}), 400
-
-        answers = data["answers"]
-        questions = data["questions"]
-        subject = data.get("subject", "General")
+        if not data or "answers" not in data:
+            return error_response("Invalid request format", 400)
 
-        correct_count = 0
-        total_gradeable_questions = 0
-        detailed_results = []
+        # Without questions in the body, grade the user's last generated
+        # exam from the server's copy. That copy needs Redis and is claimed
+        # here, so each generated exam is graded from it at most once.
+        exam_state = None if "questions" in data else claim_exam_state(user_id)
+        if "questions" not in data and exam_state is None:
+            return error_response("Exam state not found, resend questions", 400)
 
-        # Create a new exam result first to get the exam_id
-        conn = get_db_connection("exam_results.db")
-        cursor = conn.cursor()
-        
-        # Insert initial result to get exam_id
-        cursor.execute("""
-            INSERT INTO results (
-                user_id, score, grade, status, subject,
-                total_questions, correct_answers, timestamp
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        """, (user_id, 0, 'P', 'In Progress', subject, len(questions), 0))
-        exam_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        answers = data["answers"]
+        questions = data["questions"] if exam_state is None else exam_state["questions"]
+        subject = data.get("subject", "General" if exam_state is None else exam_state["subject"])
+
+        graded, total_gradeable_questions = grade_submission(user_id, questions, answers)
+
+        # Hand the write to the exam writer, which commits concurrent
+        # submissions together, and wait for this one's ids and final score.
+        # No timeout: a request that gave up could not stop its queued exam
+        # from being committed, and the writer always resolves the future.
+        future = Future()
+        exam_write_queue.put((user_id, subject, len(questions), total_gradeable_questions, graded, future))
+        exam_id, final, detailed_results = future.result()
+        invalidate_user_cache(user_id)
+        if exam_state is None:
+            clear_exam_state(user_id)
 
-        # Now use exam_questions.db for storing questions and answers
-        questions_conn = get_db_connection("exam_questions.db")
-        questions_cursor = questions_conn.cursor()
+        return jsonify({
+            "exam_id": exam_id,
+            "score": float(final["score"]),
+            "grade": final["grade"],
+            "correct_answers": final["correct_answers"],
+            "total_questions": total_gradeable_questions,
+            "detailed_results": detailed_results
+        })
 
-        try:
-            for question in questions:
-                q_id = str(question["id"])
-                
-                # Insert the question first
-                questions_cursor.execute("""
-                    INSERT INTO questions (
-                        exam_id, question_text, question_type,
-                        options, correct_answer, subject
-                    ) VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    exam_id,
-                    question["question"],
-                    question.get("type", ""),
-                    json.dumps(question.get("options", [])),
-                    question.get("correct_answer", ""),
-                    question.get("subject", subject)
-                ))
-                question_id = questions_cursor.lastrowid
-
-                # Get user's answer
-                user_answer = answers.get(str(q_id), "")
-                
-                # Calculate score based on question type
-                question_type = question.get("type", "").lower()
-                question_score = 0
-                feedback = None
-                evaluation_data = None
-
-                if question_type in ["mcq", "true_false"]:
-                    is_correct = str(user_answer).strip().lower() == str(question.get("correct_answer", "")).strip().lower()
-                    question_score = 100 if is_correct else 0
-                    total_gradeable_questions += 1
-                    if is_correct:
-                        correct_count += 1
-                elif question_type == "essay":
-                    evaluation = evaluate_essay(
-                        question["question"],
-                        question.get("correct_answer", ""),
-                        user_answer
-                    )
-                    question_score = evaluation.get("overall_score", 0)
-                    feedback = evaluation.get("feedback")
-                    evaluation_data = json.dumps(evaluation)
-                    total_gradeable_questions += 1
-                elif question_type == "coding":
-                    evaluation = evaluate_code(
-                        question["question"],
-                        question.get("correct_answer", ""),
-                        user_answer
-                    )
-                    question_score = evaluation.get("overall_score", 0)
-                    feedback = evaluation.get("feedback")
-                    evaluation_data = json.dumps(evaluation)
-                    total_gradeable_questions += 1
-
-                # Insert user's answer
-                questions_cursor.execute("""
-                    INSERT INTO user_answers (
-                        exam_id, user_id, question_id,
-                        answer, is_correct, time_taken
-                    ) VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    exam_id,
-                    user_id,
-                    question_id,
-                    user_answer,
-                    1 if question_score == 100 else 0,
-                    None
-                ))
+    except Exception as e:
+        print(f"Error in validate_answers: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-                detailed_results.append({
-                    "question_id": question_id,
-                    "score": question_score,
-                    "feedback": feedback,
-                    "evaluation": json.loads(evaluation_data) if evaluation_data else None
-                })
+MAX_BATCH_SUBMISSIONS = 50
 
-            questions_conn.commit()
+@app.route("/validate_answers_batch", methods=["POST"])
+@cached_jwt_required
+def validate_answers_batch():
+    """Validate several of the current user's submissions and store them in one transaction"""
+    try:
+        data = request.get_json()
+        user_id = get_jwt_identity()
 
-            # Calculate final score
-            final_score = (correct_count / total_gradeable_questions * 100) if total_gradeable_questions > 0 else 0
-            
-            # Update the final result
-            conn = get_db_connection("exam_results.db")
-            conn.execute("""
-                UPDATE results 
-                SET score = ?, grade = ?, status = ?, correct_answers = ?
-                WHERE id = ?
-            """, (final_score, calculate_grade(final_score), "Completed", correct_count, exam_id))
-            conn.commit()
-            conn.close()
+        submissions = data.get("submissions") if data else None
+        if (
+            not isinstance(submissions, list)
+            or not 0 < len(submissions) <= MAX_BATCH_SUBMISSIONS
+            or not all("answers" in item and "questions" in item for item in submissions)
+        ):
+            return error_response("Invalid request format", 400)
+
+        gradings = grade_submissions(user_id, [(item["questions"], item["answers"]) for item in submissions])
+        batch = []
+        for item, (graded, total_gradeable_questions) in zip(submissions, gradings):
+            batch.append((
+                user_id, item.get("subject", "General"), len(item["questions"]),
+                total_gradeable_questions, graded, Future()
+            ))
 
-            return jsonify({
+        # All submissions share one transaction and commit; a failing
+        # submission is rolled back and reported on its own
+        with db_pool.acquire() as conn:
+            write_exam_batch(conn, batch)
+        invalidate_user_cache(user_id)
+
+        results = []
+        for *_, total_gradeable_questions, _, future in batch:
+            try:
+                exam_id, final, detailed_results = future.result()
+            except Exception as e:
+                results.append({"error": str(e)})
+                continue
+            results.append({
                 "exam_id": exam_id,
-                "score": final_score,
-                "grade": calculate_grade(final_score),
-                "correct_answers": correct_count,
+                "score": float(final["score"]),
+                "grade": final["grade"],
+                "correct_answers": final["correct_answers"],
                 "total_questions": total_gradeable_questions,
                 "detailed_results": detailed_results
             })
 
-        finally:
-            questions_conn.close()
+        return jsonify({"results": results})
 
     except Exception as e:
-        print(f"Error in validate_answers: {str(e)}")
+        print(f"Error in validate_answers_batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/grade_exam_batch/<int:exam_id>", methods=["POST"])
+@cached_jwt_required
+def submit_exam_batch(exam_id):
+    """Queue an exam's essay/coding answers for OpenAI Batch API grading"""
+    try:
+        user_id = get_jwt_identity()
+
+        with db_pool.acquire() as conn:
+            result = conn.execute(
+                "SELECT status, batch_id, batch_claimed_at FROM results WHERE id = ? AND user_id = ?",
+                (exam_id, user_id)
+            ).fetchone()
+        if not result:
+            return error_response("Exam not found", 404)
+        if batch_in_progress(result["status"], result["batch_id"], result["batch_claimed_at"]):
+            return error_response("Batch grading is already in progress for this exam", 409)
+
+        batch_id = grade_exam_batch(exam_id)
+        invalidate_user_cache(user_id)
+        return jsonify({
+            "exam_id": exam_id,
+            "batch_id": batch_id,
+            "status": "In Progress"
+        })
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in submit_exam_batch: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/grade_exam_batch/<int:exam_id>", methods=["GET"])
+@cached_jwt_required
+def poll_exam_batch(exam_id):
+    """Check an exam's batch grading job and apply its results once finished"""
+    try:
+        user_id = get_jwt_identity()
+
+        with db_pool.acquire() as conn:
+            result = conn.execute(
+                "SELECT batch_id, batch_status, status FROM results WHERE id = ? AND user_id = ?",
+                (exam_id, user_id)
+            ).fetchone()
+        if not result:
+            return error_response("Exam not found", 404)
+        if not result["batch_id"]:
+            return error_response("No batch grading was submitted for this exam", 400)
+
+        if result["status"] == "In Progress":
+            batch_status = apply_exam_batch(exam_id, result["batch_id"])
+            if batch_status == "completed" or batch_status in BATCH_FAILED_STATUSES:
+                invalidate_user_cache(user_id)
+        else:
+            batch_status = result["batch_status"] or "completed"
+
+        return jsonify({
+            "exam_id": exam_id,
+            "batch_id": result["batch_id"],
+            "batch_status": batch_status
+        })
+
+    except Exception as e:
+        print(f"Error in poll_exam_batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# A user's results with each exam's subject resolved to the most common
+# question subject, falling back to the subject stored on the result.
+# Takes the user id twice.
+USER_RESULTS_CTE = """
+    WITH exam_subjects AS (
+        SELECT
+            exam_id,
+            subject,
+            ROW_NUMBER() OVER (
+                PARTITION BY exam_id
+                ORDER BY COUNT(*) DESC
+            ) as rank
+        FROM questions
+        WHERE exam_id IN (SELECT id FROM results WHERE user_id = ?)
+        GROUP BY exam_id, subject
+    ),
+    user_results AS (
+        SELECT
+            r.id, r.user_id, r.score, r.grade, r.status, r.timestamp,
+            r.total_questions, r.correct_answers,
+            COALESCE(es.subject, NULLIF(r.subject, ''), 'General') as resolved_subject
+        FROM results r
+        LEFT JOIN exam_subjects es ON es.exam_id = r.id AND es.rank = 1
+        WHERE r.user_id = ?
+    )
+"""
+
+# Response fields of each get_results entry, in SELECT order
+RESULT_COLUMNS = (
+    "id", "user_id", "score", "grade", "status", "timestamp",
+    "subject", "total_questions", "correct_answers"
+)
+USER_RESULTS_SQL = USER_RESULTS_CTE + """
+    SELECT
+        id, user_id, score, grade, status, timestamp,
+        resolved_subject, total_questions, correct_answers
+    FROM user_results
+    ORDER BY timestamp DESC, id DESC
+"""
+USER_SUBJECT_STATS_SQL = USER_RESULTS_CTE + """
+    SELECT resolved_subject, COUNT(*) as exam_count, AVG(score) as average_score
+    FROM user_results
+    GROUP BY resolved_subject
+"""
+
+# Histories longer than this are streamed from the cursor instead of being
+# built, encoded and cached in one piece
+RESULTS_STREAM_THRESHOLD = 500  # exams
+RESULTS_STREAM_CHUNK = 200  # rows fetched and encoded per yield
+
+# One streamed page of a user's results, newest first. Pages are keyed on the
+# last (timestamp, id) sent so each one is a fresh short query; both are NULL
+# for the first page.
+USER_RESULTS_PAGE_SQL = """
+    WITH page AS (
+        SELECT
+            id, user_id, score, grade, status, timestamp,
+            total_questions, correct_answers, subject
+        FROM results
+        WHERE user_id = :user_id
+          AND (:timestamp IS NULL OR (timestamp, id) < (:timestamp, :id))
+        ORDER BY timestamp DESC, id DESC
+        LIMIT :limit
+    ),
+    exam_subjects AS (
+        SELECT
+            exam_id,
+            subject,
+            ROW_NUMBER() OVER (
+                PARTITION BY exam_id
+                ORDER BY COUNT(*) DESC
+            ) as rank
+        FROM questions
+        WHERE exam_id IN (SELECT id FROM page)
+        GROUP BY exam_id, subject
+    )
+    SELECT
+        p.id, p.user_id, p.score, p.grade, p.status, p.timestamp,
+        COALESCE(es.subject, NULLIF(p.subject, ''), 'General'),
+        p.total_questions, p.correct_answers
+    FROM page p
+    LEFT JOIN exam_subjects es ON es.exam_id = p.id AND es.rank = 1
+    ORDER BY p.timestamp DESC, p.id DESC
+"""
+
+def stream_results(user_id: str, statistics: dict):
+    """Yield the get_results JSON body a page of rows at a time.
+
+    Each page is fetched and encoded under its own short pool checkout, so a
+    slow client never pins a connection between yields.
+    """
+    params = {"user_id": user_id, "timestamp": None, "id": None, "limit": RESULTS_STREAM_CHUNK}
+    yield b'{"results":['
+    separator = b""
+    while True:
+        with db_pool.acquire() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            rows = cursor.execute(USER_RESULTS_PAGE_SQL, params).fetchall()
+            if not rows:
+                break
+            chunk = separator + b",".join(orjson.dumps(dict(zip(RESULT_COLUMNS, row))) for row in rows)
+        if statistics["last_exam_score"] is None:
+            statistics["last_exam_score"] = rows[0][RESULT_COLUMNS.index("score")]
+        params["timestamp"] = rows[-1][RESULT_COLUMNS.index("timestamp")]
+        params["id"] = rows[-1][RESULT_COLUMNS.index("id")]
+        yield chunk
+        separator = b","
+        if len(rows) < RESULTS_STREAM_CHUNK:
+            break
+    yield b'],"statistics":' + orjson.dumps(statistics, option=orjson.OPT_NON_STR_KEYS) + b"}"
+
 @app.route("/get_results", methods=["GET"])
-@jwt_required()
+@cached_jwt_required
 def get_results():
     """Retrieve exam results for the current user"""
     try:
         user_id = get_jwt_identity()
+
+        cache_key = f"results:{user_id}"
+        cached = cache_get(cache_key)
+        if cached:
+            return app.response_class(cached, mimetype="application/json")
         
-        # First get results from results table
-        results_conn = get_db_connection("exam_results.db")
-        results = results_conn.execute("""
-            SELECT * FROM results 
-            WHERE user_id = ? 
-            ORDER BY timestamp DESC
-        """, (user_id,)).fetchall()
-        results_conn.close()
-
-        if not results:
-            return jsonify({"message": "No results found"}), 404
-
-        # Get subjects from questions table for each exam
-        questions_conn = get_db_connection("exam_questions.db")
-        results_list = []
-        
-        for row in results:
-            # Convert sqlite3.Row to dict
-            result_dict = dict(row)
-            
-            # Get the most common subject for this exam
-            subjects = questions_conn.execute("""
-                SELECT subject, COUNT(*) as count 
-                FROM questions 
-                WHERE exam_id = ? 
-                GROUP BY subject 
-                ORDER BY count DESC 
-                LIMIT 1
-            """, (result_dict["id"],)).fetchone()
-
-            # Convert subjects Row to dict if it exists
-            subject = dict(subjects)["subject"] if subjects else result_dict["subject"] if "subject" in result_dict else "General"
-            
-            results_list.append({
-                "id": result_dict["id"],
-                "user_id": result_dict["user_id"],
-                "score": result_dict["score"],
-                "grade": result_dict["grade"],
-                "status": result_dict["status"],
-                "timestamp": result_dict["timestamp"],
-                "subject": subject,
-                "total_questions": result_dict["total_questions"],
-                "correct_answers": result_dict["correct_answers"]
-            })
-        
-        questions_conn.close()
-
-        # Calculate statistics by subject
-        subjects = {}
-        for r in results_list:
-            subj = r["subject"]
-            if subj not in subjects:
-                subjects[subj] = {"count": 0, "total_score": 0}
-            subjects[subj]["count"] += 1
-            subjects[subj]["total_score"] += r["score"]
-
-        subject_stats = {
-            subj: {
-                "average_score": round(data["total_score"] / data["count"], 2),
-                "exam_count": data["count"]
-            }
-            for subj, data in subjects.items()
-        }
+        with db_pool.acquire() as conn:
+            # Aggregate statistics by subject in SQLite
+            subject_rows = conn.execute(USER_SUBJECT_STATS_SQL, (user_id, user_id)).fetchall()
 
-        return jsonify({
-            "results": results_list,
-            "statistics": {
-                "total_exams": len(results_list),
-                "average_score": round(
-                    sum(r["score"] for r in results_list) / len(results_list)
-                    if results_list else 0, 
-                    2
-                ),
-                "last_exam_score": results_list[0]["score"] if results_list else 0,
+            if not subject_rows:
+                return jsonify({"message": "No results found"}), 404
+
+            subject_stats = {
+                row["resolved_subject"]: {
+                    "average_score": round(row["average_score"], 2),
+                    "exam_count": row["exam_count"]
+                }
+                for row in subject_rows
+            }
+            total_exams = sum(row["exam_count"] for row in subject_rows)
+            total_score = sum(row["average_score"] * row["exam_count"] for row in subject_rows)
+            statistics = {
+                "total_exams": total_exams,
+                "average_score": round(total_score / total_exams if total_exams else 0, 2),
+                "last_exam_score": None,
                 "by_subject": subject_stats
             }
-        })
+
+            if total_exams <= RESULTS_STREAM_THRESHOLD:
+                # Plain tuples in RESULT_COLUMNS order skip sqlite3.Row lookups
+                cursor = conn.cursor()
+                cursor.row_factory = None
+                results = cursor.execute(USER_RESULTS_SQL, (user_id, user_id)).fetchall()
+
+        if total_exams > RESULTS_STREAM_THRESHOLD:
+            return app.response_class(stream_with_context(stream_results(user_id, statistics)), mimetype="application/json")
+
+        results_list = [dict(zip(RESULT_COLUMNS, row)) for row in results]
+        statistics["last_exam_score"] = results_list[0]["score"]
+        body = orjson.dumps({"results": results_list, "statistics": statistics}, option=orjson.OPT_NON_STR_KEYS)
+        cache_set(cache_key, body)
+        return app.response_class(body, mimetype="application/json")
 
     except Exception as e:
         print(f"Error in get_results: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route("/exam_detail/<int:exam_id>", methods=["GET"])
-@jwt_required()
+@cached_jwt_required
 def get_exam_detail(exam_id):
     """Get detailed exam result"""
     try:
         user_id = get_jwt_identity()
+
+        cached = detail_cache_get(user_id, exam_id)
+        if cached:
+            return app.response_class(cached, mimetype="application/json")
         
         # Get exam details
         exam_detail = get_exam_details(exam_id, user_id)
         
         if not exam_detail:
-            return jsonify({"error": "Exam not found"}), 404
-            
-        return jsonify(exam_detail)
+            return error_response("Exam not found", 404)
+
+        body = orjson.dumps(exam_detail)
+        detail_cache_set(user_id, exam_id, body)
+        return app.response_class(body, mimetype="application/json")
         
     except Exception as e:
         print(f"Error in get_exam_detail endpoint: {str(e)}")
         return jsonify({"error": "Failed to get exam detail", "details": str(e)}), 500
 
 @app.route("/submit_exam", methods=["POST"])
-@jwt_required()
+@cached_jwt_required
 def submit_exam():
     """Handle exam submission"""
     try:
@@ -1165,21 +2701,20 @@ def submit_exam():
         data = request.get_json()
         
         if not data or 'questions' not in data or 'answers' not in data:
-            return jsonify({"error": "Invalid submission data"}), 400
+            return error_response("Invalid submission data", 400)
         
         questions = data['questions']
         answers = data['answers']
+        subject = data.get('subject', 'General')
         
-        # Calculate score
+        # Calculate score; each comparison counts as 0 or 1
         total_questions = len(questions)
-        correct_answers = sum(
-            1 for q in questions
-            if answers.get(str(q['id'])) == q['correct_answer']
-        )
+        correctness = {str(q['id']): answers.get(str(q['id'])) == q['correct_answer'] for q in questions}
+        correct_answers = sum(correctness.values())
         score = round((correct_answers / total_questions) * 100, 2) if total_questions > 0 else 0
         
-        # Save all exam data
-        exam_id = save_exam_result(user_id, questions, answers, score)
+        # Save all exam data; the stored per-answer results match the score
+        exam_id = save_exam_result(user_id, questions, answers, score, subject, correctness=correctness)
         
         return jsonify({
             "message": "Exam submitted successfully",
@@ -1190,10 +2725,10 @@ def submit_exam():
         
     except Exception as e:
         print(f"Error in submit_exam: {str(e)}")
-        return jsonify({"error": "Failed to submit exam"}), 500
+        return error_response("Failed to submit exam", 500)
 
 @app.route("/update_profile", methods=["PUT"])
-@jwt_required()
+@cached_jwt_required
 def update_profile():
     try:
         current_user_email = get_jwt_identity()  # This gets the email from the token
@@ -1203,10 +2738,9 @@ def update_profile():
         last_name = data.get("last_name")
         
         if not all([first_name, last_name]):
-            return jsonify({"error": "First name and last name are required"}), 400
+            return error_response("First name and last name are required", 400)
 
-        conn = get_db_connection("users.db")
-        try:
+        with db_pool.acquire() as conn:
             # Update using email instead of user_id
             conn.execute(
                 """
@@ -1217,57 +2751,72 @@ def update_profile():
                 (first_name, last_name, current_user_email)
             )
             conn.commit()
-            
+
             # Fetch updated user data
             user = conn.execute(
                 "SELECT email, first_name, last_name FROM users WHERE email = ?",
                 (current_user_email,)
             ).fetchone()
-            
-            if user:
-                updated_user = {
-                    "email": user["email"],
-                    "first_name": user["first_name"],
-                    "last_name": user["last_name"]
-                }
-                return jsonify({
-                    "message": "Profile updated successfully",
-                    "user": updated_user
-                })
-            else:
-                return jsonify({"error": "User not found"}), 404
-                
-        finally:
-            conn.close()
+        
+        if user:
+            updated_user = {
+                "email": user["email"],
+                "first_name": user["first_name"],
+                "last_name": user["last_name"]
+            }
+            return jsonify({
+                "message": "Profile updated successfully",
+                "user": updated_user
+            })
+        else:
+            return error_response("User not found", 404)
     except Exception as e:
         print(f"Error updating profile: {str(e)}")  # Add logging
-        return jsonify({"error": "Failed to update profile"}), 500
+        return error_response("Failed to update profile", 500)
 
 # Add this route to test if the API is accessible
+HEALTH_RESPONSE_BODY = b'{"status":"healthy"}'
+
 @app.route("/health", methods=["GET"])
 def health_check():
-    return jsonify({"status": "healthy"}), 200
+    return app.response_class(HEALTH_RESPONSE_BODY, mimetype="application/json")
 
-def get_level_specific_rules(level: str) -> str:
-    """Get specific rules for each difficulty level"""
-    rules = {
-        "basic": """
+class HealthMiddleware:
+    """Answer load-balancer health probes at the WSGI layer, before Flask
+    builds a request context; every other request goes to the app"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") == "/health" and environ.get("REQUEST_METHOD") in ("GET", "HEAD"):
+            start_response("200 OK", [
+                ("Content-Type", "application/json"),
+                ("Content-Length", str(len(HEALTH_RESPONSE_BODY)))
+            ])
+            return [HEALTH_RESPONSE_BODY]
+        return self.wsgi_app(environ, start_response)
+
+app.wsgi_app = HealthMiddleware(app.wsgi_app)
+
+LEVEL_RULES = {
+    "basic": """
         - Questions should cover fundamental concepts
         - Use simple, clear language
         - Focus on direct recall and basic understanding
         - Avoid complex terminology
         - Include straightforward scenarios
         """,
-        
-        "intermediate": """
+
+    "intermediate": """
         - Questions should require deeper understanding
         - Test application of concepts
         - Can include some technical terminology
         - May combine multiple basic concepts
         - Include practical scenarios
         """,
-        
-        "advanced": """
+
+    "advanced": """
         - Questions should test complex understanding
         - Include advanced concepts and edge cases
         - Use technical terminology appropriately
@@ -1275,10 +2824,9 @@ def get_level_specific_rules(level: str) -> str:
         - Can combine multiple concepts
         - Include challenging scenarios
         """
-    }
-    return rules.get(level, "Follow standard difficulty level guidelines.")
+}
 
-if __name__ == "__main__":
-    init_databases()
-    verify_db_structure()
-    app.run(debug=True, port=5000)
+@lru_cache(maxsize=8)
+def get_level_specific_rules(level: str) -> str:
+    """Get specific rules for each difficulty level"""
+    return LEVEL_RULES.get(level, "Follow standard difficulty level guidelines.")
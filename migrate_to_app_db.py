@@ -0,0 +1,59 @@
+import sqlite3
+import os
+
+DB_NAME = "app.db"
+
+# Legacy database file -> {legacy table: app.db table}
+LEGACY_TABLES = {
+    "users.db": {"users": "users"},
+    "exam_results.db": {"results": "results", "detailed_results": "results_detailed"},
+    "exam_questions.db": {"questions": "questions", "user_answers": "user_answers"}
+}
+
+def get_columns(conn: sqlite3.Connection, schema: str, table: str) -> list:
+    """Return the column names of a table in the given schema"""
+    return [col[1] for col in conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()]
+
+def migrate_databases():
+    """Copy rows from the legacy per-area database files into app.db.
+
+    Run once after app.db has been created (by init_db.py or by starting the
+    app). Only columns present on both sides are copied, so databases created
+    by older schema versions migrate as well.
+    """
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        for db_file, tables in LEGACY_TABLES.items():
+            if not os.path.exists(db_file):
+                print(f"Skipping {db_file}: file not found")
+                continue
+
+            conn.execute("ATTACH DATABASE ? AS old", (db_file,))
+            try:
+                for old_table, new_table in tables.items():
+                    old_columns = get_columns(conn, "old", old_table)
+                    new_columns = get_columns(conn, "main", new_table)
+                    if not old_columns or not new_columns:
+                        print(f"Skipping {db_file}:{old_table}: table not found")
+                        continue
+
+                    columns = ", ".join(col for col in old_columns if col in new_columns)
+                    cursor = conn.execute(
+                        f"INSERT INTO main.{new_table} ({columns}) "
+                        f"SELECT {columns} FROM old.{old_table}"
+                    )
+                    print(f"Copied {cursor.rowcount} rows from {db_file}:{old_table} to {new_table}")
+                conn.commit()
+            finally:
+                conn.execute("DETACH DATABASE old")
+    except Exception as e:
+        print(f"Error migrating databases: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    print(f"Migrating legacy databases into {DB_NAME}...")
+    migrate_databases()
+    print("Database migration completed")
@@ -0,0 +1,8 @@
+# WSGI entry point: gunicorn -k gthread -w 4 --threads 8 --timeout 60 wsgi:app
+# Importing main initializes the database schema and starts the background writers.
+from main import app, verify_db_structure
+
+if __name__ == "__main__":
+    # Local development only; production runs under gunicorn (see Procfile)
+    verify_db_structure()
+    app.run(port=5000, threaded=True)